@@ -1,63 +1,77 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 import requests
 import os
+import math
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
 from functools import wraps
 from pathlib import Path
 import google.generativeai as genai
-import hashlib
 import uuid
 import json
+from user_store import UserStore, DuplicateUserError, LIST_SECTIONS
+from passwords import PasswordHasher
+from sessions import (SessionStore, ServerSessionInterface, MemorySessionBackend,
+                      SQLiteSessionBackend)
+from spoonacular import SpoonacularClient
+from recipes import RecipeDetailService, RecipeCache, recipe_id_int
+from gemini import GeminiModels, GeminiUnavailableError, DEFAULT_MODELS
+from semantic_cache import SemanticCache
+from nutrition_db import IngredientNutritionDB
+from nutrition_parser import parse_nutrition
+from meal_planner import daily_targets, nutrient_matrix, plan_meals
+from response_cache import ResponseCache, make_key, normalize_text, normalize_ingredients
+from recipe_pool import RecipePool, recipe_diets, recipe_ingredients
+from rate_limit import UpstreamScheduler, INTERACTIVE, priority
+from quota import QuotaTracker
+from restrictions import compile_restrictions, ingredient_words, parse_liked_foods
 
 # Load .env from the project root (two directories up from backend)
 load_dotenv('../../.env')
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-change-in-production'  # For session management
+# Sessions are kept server side under random IDs, so nothing depends on a
+# signing key; set SECRET_KEY for extensions that need one
+app.secret_key = os.getenv('SECRET_KEY')
 CORS(app, supports_credentials=True)
 
-# User management functions
-
-
-def load_users():
-    """Load users from JSON file"""
-    try:
-        with open('users.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"users": {}}
+# Server-side sessions holding the user ID and a user summary for auth
+# checks. The SQLite backend is shared by all workers; 'memory' only works
+# with a single worker.
+session_store = SessionStore(
+    MemorySessionBackend() if os.getenv('SESSION_BACKEND', 'sqlite') == 'memory'
+    else SQLiteSessionBackend(os.getenv('SESSION_DB_PATH', 'sessions.db')),
+    ttl=float(os.getenv('SESSION_TTL', 7 * 24 * 3600)),
+    local_ttl=float(os.getenv('SESSION_LOCAL_TTL', 10)),
+    sweep_interval=float(os.getenv('SESSION_SWEEP_INTERVAL', 300)))
+app.session_interface = ServerSessionInterface(session_store)
 
+# User management functions
 
-def save_users(users_data):
-    """Save users to JSON file"""
-    with open('users.json', 'w') as f:
-        json.dump(users_data, f, indent=2)
-
+user_store = UserStore(os.getenv('USER_DB_PATH', 'users.db'),
+                       legacy_json_path='users.json',
+                       cache_size=int(os.getenv('USER_CACHE_SIZE', 512)),
+                       group_commit_ms=float(os.getenv('USER_STORE_GROUP_COMMIT_MS', 0)))
 
-def hash_password(password):
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+# Salted scrypt password hashing in worker processes; the cost settings can be
+# raised over time, and stored hashes are upgraded on login
+password_hasher = PasswordHasher(
+    n=int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14)),
+    r=int(os.getenv('PASSWORD_SCRYPT_R', 8)),
+    p=int(os.getenv('PASSWORD_SCRYPT_P', 1)),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', 0)) or None)
 
 
 def create_user(username, email, password):
     """Create a new user account"""
-    users_data = load_users()
-
-    # Check if username or email already exists
-    for user_id, user in users_data['users'].items():
-        if user['username'] == username:
-            return False, "Username already exists"
-        if user['email'] == email:
-            return False, "Email already exists"
-
     # Create new user
     user_id = str(uuid.uuid4())
     new_user = {
         'id': user_id,
         'username': username,
         'email': email,
-        'password_hash': hash_password(password),
+        'password_hash': password_hasher.hash(password),
         'created_at': datetime.now().isoformat(),
         'diet_input': {},
         'meal_plans': [],
@@ -66,51 +80,148 @@ def create_user(username, email, password):
         'preferences': {}
     }
 
-    users_data['users'][user_id] = new_user
-    save_users(users_data)
+    # The store checks username/email uniqueness in the same transaction
+    try:
+        user_store.insert(new_user)
+    except DuplicateUserError as e:
+        return False, f"{e.field.title()} already exists"
     return True, user_id
 
 
 def authenticate_user(username, password):
     """Authenticate user login"""
-    users_data = load_users()
-
-    for user_id, user in users_data['users'].items():
-        if user['username'] == username and user['password_hash'] == hash_password(password):
-            return True, user_id, user
+    user_id = user_store.find_id('username', username)
+    if user_id:
+        user = user_store.get(user_id)
+        if user:
+            matches, upgraded = password_hasher.check(password, user['password_hash'])
+            if upgraded:
+                # Legacy SHA-256 hash or older cost settings
+                update_user_data(user_id, 'password_hash', upgraded)
+            if matches:
+                return True, user_id, user
     return False, None, None
 
 
 def get_user_data(user_id):
     """Get user data by ID"""
-    users_data = load_users()
-    return users_data['users'].get(user_id)
+    return user_store.get(user_id)
 
 
 def update_user_data(user_id, data_type, data):
     """Update specific user data"""
-    users_data = load_users()
-    if user_id in users_data['users']:
-        users_data['users'][user_id][data_type] = data
-        save_users(users_data)
-        return True
-    return False
+    return user_store.update_field(user_id, data_type, data)
+
+
+def append_user_data(user_id, data_type, items):
+    """Append items to a list section of user data"""
+    return user_store.append_items(user_id, data_type, items)
+
+
+def patch_user_data(user_id, data_type, upsert, remove):
+    """Replace, add or remove items (matched by id) in a list section"""
+    return user_store.patch_items(user_id, data_type, upsert, remove)
+
+
+def get_user_data_page(user_id, data_type, offset, limit):
+    """Get one page of a list section of user data"""
+    return user_store.get_items(user_id, data_type, offset, limit)
 
 
 API_KEY = os.getenv('VITE_SPOONACULAR_API_KEY')
 GEMINI_API_KEY = os.getenv('VITE_GEMINI_API_KEY')
-BASE_URL = 'https://api.spoonacular.com'
+
+
+# Spoonacular points used today, per endpoint and per user. With the daily
+# points of our plan set (unset or 0: use X-API-Quota-Left if sent), callers
+# degrade to cheaper calls below the low budget mark (default a tenth) and
+# calls stop once it is spent.
+spoonacular_quota = QuotaTracker(
+    daily_limit=float(os.getenv('SPOONACULAR_DAILY_POINTS') or 0) or None,
+    low_budget=float(os.getenv('SPOONACULAR_LOW_BUDGET_POINTS') or 0) or None)
+
+# Upstream call scheduling, matched to the Spoonacular plan's request rate
+# and to the Gemini quota. Calls beyond the rate or concurrency queue up,
+# interactive meal plans first, for at most the max queue wait.
+spoonacular_scheduler = UpstreamScheduler(
+    'spoonacular',
+    rate=float(os.getenv('SPOONACULAR_RATE_PER_SECOND', 1)),
+    burst=float(os.getenv('SPOONACULAR_BURST', 5)),
+    max_concurrency=int(os.getenv('SPOONACULAR_MAX_CONCURRENCY', 5)),
+    budget=spoonacular_quota,
+    max_wait=float(os.getenv('SPOONACULAR_MAX_QUEUE_WAIT', 10)))
+gemini_scheduler = UpstreamScheduler(
+    'gemini',
+    rate=float(os.getenv('GEMINI_RATE_PER_SECOND', 1)),
+    burst=float(os.getenv('GEMINI_BURST', 5)),
+    max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', 8)),
+    max_wait=float(os.getenv('GEMINI_MAX_QUEUE_WAIT', 20)))
+
+# Shared, pooled client for every Spoonacular call
+spoonacular = SpoonacularClient(
+    API_KEY,
+    pool_size=int(os.getenv('SPOONACULAR_POOL_SIZE', 20)),
+    connect_timeout=float(os.getenv('SPOONACULAR_CONNECT_TIMEOUT', 5)),
+    read_timeout=float(os.getenv('SPOONACULAR_READ_TIMEOUT', 15)),
+    retries=int(os.getenv('SPOONACULAR_RETRIES', 3)),
+    scheduler=spoonacular_scheduler,
+    quota=spoonacular_quota
+)
+
+# Results of recipe and by-ingredient searches, keyed on normalized params
+search_cache = ResponseCache(
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', 300)),
+    stale_ttl=float(os.getenv('SEARCH_CACHE_STALE_TTL', 3600)),
+    max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 2000)),
+    serve_stale=spoonacular_quota.low
+)
+
+# Recipes from past searches, indexed to answer filtered searches locally
+recipe_pool = RecipePool(
+    max_recipes=int(os.getenv('RECIPE_POOL_MAX_RECIPES', 5000)),
+    ttl=float(os.getenv('RECIPE_POOL_TTL', 24 * 3600)))
 
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 else:
     print("Warning: Google Gemini API key not configured. Some features may not work.")
 
+# Reused Gemini model handles, routed to the first model that is working
+gemini = GeminiModels(
+    [name.strip() for name in os.getenv('GEMINI_MODELS', ','.join(DEFAULT_MODELS)).split(',')
+     if name.strip()],
+    cooldown=float(os.getenv('GEMINI_MODEL_COOLDOWN', 60)),
+    unavailable_cooldown=float(os.getenv('GEMINI_MODEL_UNAVAILABLE_COOLDOWN', 3600)),
+    scheduler=gemini_scheduler)
+
+# Gemini answers to chatbot questions and nutrition prompts, matched on the
+# normalized text and, above the similarity threshold, on near-duplicates
+chat_cache = SemanticCache(
+    ttl=float(os.getenv('CHAT_CACHE_TTL', 24 * 3600)),
+    max_entries=int(os.getenv('CHAT_CACHE_MAX_ENTRIES', 5000)),
+    threshold=float(os.getenv('CHAT_CACHE_SIMILARITY', 0.85)))
+nutrition_prompt_cache = SemanticCache(
+    ttl=float(os.getenv('NUTRITION_PROMPT_CACHE_TTL', 7 * 24 * 3600)),
+    max_entries=int(os.getenv('NUTRITION_PROMPT_CACHE_MAX_ENTRIES', 5000)),
+    threshold=float(os.getenv('NUTRITION_PROMPT_CACHE_SIMILARITY', 0.95)))
+
 ingredients_list = []
 saved_recipes = []
 user_preferences = []
 user_food_preferences = []
 
+
+
+@app.before_request
+def attribute_quota():
+    """Charge this request's Spoonacular calls to the signed-in user"""
+    spoonacular_quota.set_user(session.get('user_id'))
+
+
+@app.teardown_request
+def clear_quota_user(exc):
+    spoonacular_quota.set_user(None)
+
 # Error handling for API requests
 
 
@@ -175,14 +286,18 @@ def login():
     success, user_id, user_data = authenticate_user(username, password)
 
     if success:
+        summary = {
+            'id': user_id,
+            'username': user_data['username'],
+            'email': user_data['email']
+        }
+        session.regenerate()
         session['user_id'] = user_id
+        # Answers auth checks without reading the user store
+        session['user'] = summary
         return jsonify({
             'message': 'Login successful',
-            'user': {
-                'id': user_id,
-                'username': user_data['username'],
-                'email': user_data['email']
-            }
+            'user': summary
         }), 200
     else:
         return jsonify({'error': 'Invalid username or password'}), 401
@@ -192,7 +307,7 @@ def login():
 @handle_errors
 def logout():
     """User logout endpoint"""
-    session.pop('user_id', None)
+    session.clear()
     return jsonify({'message': 'Logout successful'}), 200
 
 
@@ -200,18 +315,12 @@ def logout():
 @handle_errors
 def check_auth():
     """Check if user is authenticated"""
-    user_id = session.get('user_id')
-    if user_id:
-        user_data = get_user_data(user_id)
-        if user_data:
-            return jsonify({
-                'authenticated': True,
-                'user': {
-                    'id': user_id,
-                    'username': user_data['username'],
-                    'email': user_data['email']
-                }
-            }), 200
+    user = session.get('user')
+    if user:
+        return jsonify({
+            'authenticated': True,
+            'user': user
+        }), 200
 
     return jsonify({'authenticated': False}), 401
 
@@ -228,6 +337,26 @@ def get_user_data_endpoint(data_type):
 
     print(f"Getting {data_type} for user {user_id}")
 
+    # Paginated read of a list section, e.g. ?offset=20&limit=10
+    if data_type in LIST_SECTIONS and ('offset' in request.args or 'limit' in request.args):
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = request.args.get('limit')
+            limit = max(0, int(limit)) if limit else None
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers'}), 400
+
+        page = get_user_data_page(user_id, data_type, offset, limit)
+        if page is None:
+            return jsonify({'error': 'Data type not found'}), 404
+        items, total = page
+        return jsonify({
+            data_type: items,
+            'offset': offset,
+            'limit': limit,
+            'total': total
+        }), 200
+
     user_data = get_user_data(user_id)
     if not user_data:
         print(f"User {user_id} not found")
@@ -259,14 +388,158 @@ def save_user_data_endpoint(data_type):
     success = update_user_data(user_id, data_type, data)
     if success:
         print(f"Successfully saved {data_type}")
+        if data_type in ('username', 'email') and session.get('user'):
+            # Auth checks answer from the session's copy of these fields
+            session['user'] = dict(session['user'], **{data_type: data})
         return jsonify({'message': f'{data_type} saved successfully'}), 200
     else:
         print(f"Failed to save {data_type}")
         return jsonify({'error': 'Failed to save data'}), 500
 
+
+
+@app.route('/api/user/data/<data_type>/append', methods=['POST'])
+@handle_errors
+def append_user_data_endpoint(data_type):
+    """Append one item or a list of items to a list section"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    if data_type not in LIST_SECTIONS:
+        return jsonify({'error': f'{data_type} does not support appending'}), 400
+
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    items = data if isinstance(data, list) else [data]
+    print(f"Appending {len(items)} {data_type} items for user {user_id}")
+
+    total = append_user_data(user_id, data_type, items)
+    if total is None:
+        return jsonify({'error': 'Data type not found'}), 404
+    return jsonify({
+        'message': f'{data_type} updated successfully',
+        'appended': len(items),
+        'total': total
+    }), 200
+
+
+@app.route('/api/user/data/<data_type>', methods=['PATCH'])
+@handle_errors
+def patch_user_data_endpoint(data_type):
+    """Upsert and remove items of a list section by their id"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    if data_type not in LIST_SECTIONS:
+        return jsonify({'error': f'{data_type} does not support patching'}), 400
+
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected an object with upsert and/or remove'}), 400
+
+    upsert = data.get('upsert', [])
+    remove = data.get('remove', [])
+    if not isinstance(upsert, list) or not isinstance(remove, list):
+        return jsonify({'error': 'upsert and remove must be lists'}), 400
+
+    print(f"Patching {data_type} for user {user_id}: "
+          f"{len(upsert)} upserted, {len(remove)} removed")
+
+    total = patch_user_data(user_id, data_type, upsert, remove)
+    if total is None:
+        return jsonify({'error': 'Data type not found'}), 404
+    return jsonify({
+        'message': f'{data_type} updated successfully',
+        'total': total
+    }), 200
+
 # generate recommendations using Google Gemini
 
 
+# Local per-100 g ingredient nutrition, from the bundled dataset plus
+# ingredients previously resolved through Spoonacular
+ingredient_db = IngredientNutritionDB(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 'data', 'ingredient_nutrition.csv'),
+    learned_db_path=os.getenv('INGREDIENT_CACHE_PATH', 'ingredient_cache.db'))
+
+# Bounded pool for looking up unknown ingredients in parallel
+ingredient_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('INGREDIENT_LOOKUP_WORKERS', 8)))
+
+
+def fetch_ingredient_nutrition(ingredient):
+    """Look up per-100 g (calories, protein, carbs, fat) for one ingredient on Spoonacular"""
+    try:
+        # Search for the specific ingredient
+        ingredient_response = spoonacular.get('food/ingredients/search', params={
+            'query': ingredient,
+            'number': 1
+        })
+        if not ingredient_response.ok:
+            return None
+        ingredient_data = ingredient_response.json()
+        if not ingredient_data.get('results'):
+            return None
+        ingredient_id = ingredient_data['results'][0]['id']
+
+        # Get nutrition for this ingredient
+        nutrition_response = spoonacular.get(f'food/ingredients/{ingredient_id}/information', params={
+            'amount': 100,  # 100g serving
+            'unit': 'g'
+        })
+        if not nutrition_response.ok:
+            return None
+        facts = parse_nutrition(nutrition_response.json().get('nutrition'))
+
+        if facts.calories is None or facts.protein is None:
+            return None
+        print(
+            f"Analyzed {ingredient}: {facts.calories} cal, {facts.protein}g protein")
+        return facts.as_tuple()
+    except Exception as e:
+        print(f"Error analyzing ingredient {ingredient}: {e}")
+        return None
+
+
+def resolve_unknown_ingredients(ingredients):
+    """Look up ingredients the local table doesn't know on Spoonacular, in
+    parallel, and add the ones found to the table"""
+    unknown = list(dict.fromkeys(ingredient for ingredient in ingredients
+                                 if ingredient_db.lookup(ingredient) is None))
+    resolved = {}
+    user = spoonacular_quota.current_user()
+
+    def lookup(ingredient):
+        # Runs on a pool thread, charged to the requesting user
+        with spoonacular_quota.attribute(user):
+            return fetch_ingredient_nutrition(ingredient)
+
+    if unknown and API_KEY:
+        fetched = ingredient_executor.map(lookup, unknown)
+        for ingredient, result in zip(unknown, fetched):
+            if result:
+                ingredient_db.add(ingredient, result)
+                resolved[ingredient] = result
+    return unknown, resolved
+
+
+def analyze_ingredients(ingredient_list):
+    """Per-100 g nutrition for each ingredient that could be resolved, plus
+    how many had to be looked up on Spoonacular"""
+    unknown, resolved = resolve_unknown_ingredients(ingredient_list)
+    values = {ingredient: resolved.get(ingredient) or ingredient_db.lookup(ingredient)
+              for ingredient in ingredient_list}
+
+    analyzed = [values[ingredient] for ingredient in ingredient_list
+                if values[ingredient]]
+    return analyzed, len(unknown) if API_KEY else 0
+
+
 @app.route('/api/estimate-nutrition', methods=['POST'])
 @handle_errors
 def estimate_nutrition():
@@ -287,89 +560,39 @@ def estimate_nutrition():
         return jsonify({'error': 'Title and ingredients are required'}), 400
 
     try:
-        # First try to get nutrition from Spoonacular by analyzing ingredients
-        if API_KEY:
-            print(f"Analyzing ingredients: {ingredients}")
-
-            # Split ingredients and analyze each one
-            ingredient_list = [ingredient.strip().lower()
-                               for ingredient in ingredients.split(',')]
-            total_calories = 0
-            total_protein = 0
-            total_carbs = 0
-            total_fat = 0
-            analyzed_ingredients = 0
-
-            for ingredient in ingredient_list:
-                try:
-                    # Search for the specific ingredient
-                    ingredient_response = requests.get(f'{BASE_URL}/food/ingredients/search', params={
-                        'query': ingredient,
-                        'number': 1,
-                        'apiKey': API_KEY
-                    })
-
-                    if ingredient_response.ok:
-                        ingredient_data = ingredient_response.json()
-                        if ingredient_data.get('results'):
-                            ingredient_id = ingredient_data['results'][0]['id']
-
-                            # Get nutrition for this ingredient
-                            nutrition_response = requests.get(f'{BASE_URL}/food/ingredients/{ingredient_id}/information', params={
-                                'amount': 100,  # 100g serving
-                                'unit': 'g',
-                                'apiKey': API_KEY
-                            })
-
-                            if nutrition_response.ok:
-                                nutrition_data = nutrition_response.json()
-                                nutrients = nutrition_data.get(
-                                    'nutrition', {}).get('nutrients', [])
-
-                                calories = next(
-                                    (n for n in nutrients if n['name'] == 'Calories'), None)
-                                protein = next(
-                                    (n for n in nutrients if n['name'] == 'Protein'), None)
-                                carbs = next(
-                                    (n for n in nutrients if n['name'] == 'Carbohydrates'), None)
-                                fat = next(
-                                    (n for n in nutrients if n['name'] == 'Total Lipid (g)'), None)
-
-                                if calories and protein:
-                                    total_calories += calories['amount']
-                                    total_protein += protein['amount']
-                                    total_carbs += carbs['amount'] if carbs else 0
-                                    total_fat += fat['amount'] if fat else 0
-                                    analyzed_ingredients += 1
-                                    print(
-                                        f"Analyzed {ingredient}: {calories['amount']} cal, {protein['amount']}g protein")
-
-                except Exception as e:
-                    print(f"Error analyzing ingredient {ingredient}: {e}")
-                    continue
-
-            # If we successfully analyzed ingredients, return the totals
-            if analyzed_ingredients > 0:
-                # Adjust for typical serving size (divide by number of ingredients for rough estimate)
-                # At least 1 serving
-                serving_factor = max(1, analyzed_ingredients)
-
-                return jsonify({
-                    'calories': round(total_calories / serving_factor),
-                    'protein': round(total_protein / serving_factor, 1),
-                    'carbs': round(total_carbs / serving_factor, 1),
-                    'fat': round(total_fat / serving_factor, 1),
-                    'source': f'Spoonacular (analyzed {analyzed_ingredients} ingredients)'
-                })
+        # First analyze the ingredients, using the local nutrition table and
+        # asking Spoonacular only about ingredients it doesn't know
+        print(f"Analyzing ingredients: {ingredients}")
+        ingredient_list = [ingredient.strip().lower()
+                           for ingredient in ingredients.split(',') if ingredient.strip()]
+        analyzed, fetched_count = analyze_ingredients(ingredient_list)
+        analyzed_ingredients = len(analyzed)
+
+        # If we successfully analyzed ingredients, return the totals
+        if analyzed_ingredients > 0:
+            total_calories, total_protein, total_carbs, total_fat = (
+                sum(values[i] for values in analyzed) for i in range(4))
+
+            # Adjust for typical serving size (divide by number of ingredients for rough estimate)
+            # At least 1 serving
+            serving_factor = max(1, analyzed_ingredients)
+
+            source = 'Nutrition table' if not fetched_count else 'Spoonacular'
+            return jsonify({
+                'calories': round(total_calories / serving_factor),
+                'protein': round(total_protein / serving_factor, 1),
+                'carbs': round(total_carbs / serving_factor, 1),
+                'fat': round(total_fat / serving_factor, 1),
+                'source': f'{source} (analyzed {analyzed_ingredients} ingredients)'
+            })
 
+        if API_KEY:
             # Fallback: try recipe search if ingredient analysis failed
             print(f"Falling back to recipe search with title: {title}")
-            search_response = requests.get(f'{BASE_URL}/recipes/complexSearch', params={
+            search_response = spoonacular.get('recipes/complexSearch', params=with_nutrition({
                 'query': title,
-                'number': 1,
-                'addRecipeNutrition': True,
-                'apiKey': API_KEY
-            })
+                'number': 1
+            }))
 
             print(
                 f"Spoonacular response status: {search_response.status_code}")
@@ -377,31 +600,14 @@ def estimate_nutrition():
                 search_data = search_response.json()
                 if search_data.get('results'):
                     recipe = search_data['results'][0]
-                    nutrition = recipe.get('nutrition', {})
-                    nutrients = nutrition.get('nutrients', [])
-
-                    calories = next(
-                        (n for n in nutrients if n['name'] == 'Calories'), None)
-                    protein = next(
-                        (n for n in nutrients if n['name'] == 'Protein'), None)
-                    carbs = next(
-                        (n for n in nutrients if n['name'] == 'Carbohydrates'), None)
-                    fat = next(
-                        (n for n in nutrients if n['name'] == 'Fat'), None)
-
-                    return jsonify({
-                        'calories': calories['amount'] if calories else 0,
-                        'protein': protein['amount'] if protein else 0,
-                        'carbs': carbs['amount'] if carbs else 0,
-                        'fat': fat['amount'] if fat else 0,
-                        'source': 'Spoonacular (recipe search)'
-                    })
+                    facts = parse_nutrition(recipe.get('nutrition'))
+
+                    return jsonify(dict(facts.as_dict(),
+                                        source='Spoonacular (recipe search)'))
 
         # Fallback to Gemini AI estimation
         if GEMINI_API_KEY:
             print("Trying Gemini AI estimation")
-            model = genai.GenerativeModel('gemini-1.5-flash')
-
             prompt = f"""
 Estimate the nutritional content for this meal based on the ingredients provided.
 
@@ -419,12 +625,18 @@ Please provide estimated nutritional values for a typical serving size. Return o
 Provide realistic estimates based on common nutritional values for the ingredients listed. Round to reasonable numbers.
 """
 
-            response = model.generate_content(prompt)
+            # Same meal (title and ingredient set) asked before
+            cache_key = f"{normalize_text(title)} | {normalize_ingredients(ingredients)}"
+            text = nutrition_prompt_cache.get(cache_key)
+            if text is None:
+                _, response = gemini.generate(prompt)
+                text = response.text
+                nutrition_prompt_cache.put(cache_key, text)
 
             try:
                 # Try to parse the response as JSON
                 import json
-                result = json.loads(response.text)
+                result = json.loads(text)
                 return jsonify({
                     'calories': result.get('calories', 0),
                     'protein': result.get('protein', 0),
@@ -435,7 +647,6 @@ Provide realistic estimates based on common nutritional values for the ingredien
             except json.JSONDecodeError:
                 # If JSON parsing fails, try to extract numbers from text
                 import re
-                text = response.text
                 calories_match = re.search(
                     r'calories?[:\s]*(\d+)', text, re.IGNORECASE)
                 protein_match = re.search(
@@ -468,28 +679,78 @@ Provide realistic estimates based on common nutritional values for the ingredien
         return jsonify({'error': f'Failed to estimate nutrition: {str(e)}'}), 500
 
 
-@app.route('/api/chatbot', methods=['POST'])
+@app.route('/api/estimate-nutrition/batch', methods=['POST'])
 @handle_errors
-def chatbot():
-    """Chatbot endpoint using Gemini AI for nutrition and meal planning assistance"""
-    data = request.get_json()
-
-    if not data or 'message' not in data:
-        return jsonify({'error': 'Message is required'}), 400
-
-    user_message = data['message']
-    print(f"Chatbot request: {user_message}")
+def estimate_nutrition_batch():
+    """Estimate nutrition for many meals in one request.
 
-    if not GEMINI_API_KEY:
-        return jsonify({
-            'response': "I'm sorry, but I'm not available right now. Please check back later or contact support."
-        })
+    Body: {"meals": [{"title": ..., "ingredients": [{"name": "egg",
+    "quantity": 2, "unit": ""}, ...]}, ...]}. Ingredients may also be a
+    comma-separated string; entries without a quantity count as 100 g.
+    """
+    data = request.get_json()
+    meals = data.get('meals') if isinstance(data, dict) else None
+    if not meals or not isinstance(meals, list):
+        return jsonify({'error': 'A non-empty list of meals is required'}), 400
+
+    parsed_meals = []
+    for meal in meals:
+        ingredients = meal.get('ingredients', []) if isinstance(meal, dict) else None
+        if isinstance(ingredients, str):
+            ingredients = [{'name': name.strip()}
+                           for name in ingredients.split(',') if name.strip()]
+        if not isinstance(ingredients, list):
+            return jsonify({'error': 'Each meal needs a list of ingredients'}), 400
+
+        parsed = []
+        for ingredient in ingredients:
+            if isinstance(ingredient, str):
+                ingredient = {'name': ingredient}
+            if not isinstance(ingredient, dict) or not ingredient.get('name'):
+                return jsonify({'error': 'Each ingredient needs a name'}), 400
+            quantity = ingredient.get('quantity')
+            if quantity is not None:
+                try:
+                    quantity = float(quantity)
+                except (TypeError, ValueError):
+                    quantity = None
+                # Rejects nan and inf too
+                if quantity is None or not 0 <= quantity < math.inf:
+                    return jsonify({'error': f"Invalid quantity for {ingredient['name']}"}), 400
+            parsed.append({'name': ingredient['name'], 'quantity': quantity,
+                           'unit': ingredient.get('unit')})
+        parsed_meals.append(parsed)
+
+    # Resolve every unknown ingredient across all meals in one parallel pass
+    resolve_unknown_ingredients(
+        ingredient['name'] for parsed in parsed_meals for ingredient in parsed)
+
+    totals, unresolved = ingredient_db.estimate_meals(parsed_meals)
+    results = [{
+        'title': meal.get('title', ''),
+        'calories': round(float(row[0])),
+        'protein': round(float(row[1]), 1),
+        'carbs': round(float(row[2]), 1),
+        'fat': round(float(row[3]), 1),
+        'unresolved': missing
+    } for meal, row, missing in zip(meals, totals, unresolved)]
+
+    grand_total = totals.sum(axis=0)
+    return jsonify({
+        'meals': results,
+        'totals': {
+            'calories': round(float(grand_total[0])),
+            'protein': round(float(grand_total[1]), 1),
+            'carbs': round(float(grand_total[2]), 1),
+            'fat': round(float(grand_total[3]), 1)
+        },
+        'source': 'Nutrition table'
+    })
 
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
 
-        # Create a context-aware prompt for nutrition assistance
-        prompt = f"""
+def chatbot_prompt(user_message):
+    """Context-aware prompt for the nutrition assistant"""
+    return f"""
 You are a helpful nutrition assistant for a meal planning app. The user is asking: "{user_message}"
 
 Please provide a helpful, informative response about nutrition, meal planning, healthy eating, or general food advice. 
@@ -507,11 +768,88 @@ Guidelines:
 Respond in a helpful, conversational tone as if you're a friendly nutrition expert.
 """
 
-        response = model.generate_content(prompt)
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event with a JSON payload"""
+    lines = f"event: {event}\n" if event else ''
+    return lines + f"data: {json.dumps(data)}\n\n"
+
+
+def stream_gemini(prompt, error_text=None, cache=None, cache_key=None):
+    """Stream a Gemini response as Server-Sent Events.
+
+    Each text piece is sent as {"text": ...}; the stream ends with a 'done'
+    event naming the model, or an 'error' event. With error_text, failures
+    are sent as that text instead, like the non-streaming chatbot does. With
+    a cache, a cached answer for cache_key is sent in one piece and complete
+    answers are stored.
+    """
+    def events():
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                yield sse_event({'text': cached})
+                yield sse_event({'model_used': None, 'cached': True}, event='done')
+                return
+        pieces = None
+        try:
+            model_name, pieces = gemini.stream(prompt)
+            text = []
+            for piece in pieces:
+                text.append(piece)
+                yield sse_event({'text': piece})
+            if cache is not None and text:
+                cache.put(cache_key, ''.join(text).strip())
+            yield sse_event({'model_used': model_name}, event='done')
+        except Exception as e:
+            print(f"Gemini stream error: {e}")
+            if error_text:
+                yield sse_event({'text': error_text})
+                yield sse_event({'model_used': None}, event='done')
+            else:
+                yield sse_event({'error': str(e)}, event='error')
+        finally:
+            # Frees the Gemini slot, also when the client disconnects
+            # mid-stream and the generator is closed
+            if pieces is not None:
+                pieces.close()
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/chatbot', methods=['POST'])
+@handle_errors
+def chatbot():
+    """Chatbot endpoint using Gemini AI for nutrition and meal planning assistance"""
+    data = request.get_json()
+
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+
+    user_message = data['message']
+    print(f"Chatbot request: {user_message}")
+
+    if not GEMINI_API_KEY:
+        return jsonify({
+            'response': "I'm sorry, but I'm not available right now. Please check back later or contact support."
+        })
+
+    try:
+        # Students ask the same questions over and over
+        cached = chat_cache.get(user_message)
+        if cached is not None:
+            return jsonify({'response': cached})
+
+        prompt = chatbot_prompt(user_message)
+
+        _, response = gemini.generate(prompt)
         print(f"Chatbot response generated successfully")
 
+        reply = response.text.strip()
+        chat_cache.put(user_message, reply)
         return jsonify({
-            'response': response.text.strip()
+            'response': reply
         })
 
     except Exception as e:
@@ -521,35 +859,44 @@ Respond in a helpful, conversational tone as if you're a friendly nutrition expe
         })
 
 
-@app.route('/api/generate-recommendations', methods=['POST'])
+@app.route('/api/chatbot/stream', methods=['POST'])
 @handle_errors
-def generate_recommendations():
+def chatbot_stream():
+    """Chatbot endpoint that streams the reply as Server-Sent Events"""
     data = request.get_json()
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
 
-    if not GEMINI_API_KEY:
-        return jsonify({'error': 'Google Gemini API key not configured'}), 500
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
 
-    try:
-        # get user prefrences
-        user_prefs = data.get('userPreferences', {})
-
-        # promt format
-        if user_prefs.get('currentMeals'):
-            current_meals_text = "\n".join([
-                f"- {meal.get('type', 'Unknown')}: {meal.get('title', 'Unknown')} "
-                f"({meal.get('calories', 0):.0f} calories, {meal.get('protein', 0):.0f}g protein, "
-                f"{meal.get('carbs', 0):.0f}g carbs, {meal.get('fat', 0):.0f}g fat)"
-                for meal in user_prefs.get('currentMeals', [])
-            ])
-        else:
-            current_meals_text = "No current meal plan available"
+    if not GEMINI_API_KEY:
+        message = "I'm sorry, but I'm not available right now. Please check back later or contact support."
+        return Response(sse_event({'text': message}) +
+                        sse_event({'model_used': None}, event='done'),
+                        mimetype='text/event-stream')
+
+    return stream_gemini(
+        chatbot_prompt(data['message']),
+        error_text="I'm having trouble processing your request right now. Please try again in a moment!",
+        cache=chat_cache, cache_key=data['message'])
+
+
+def recommendations_prompt(user_prefs):
+    """Prompt asking for meal recommendations for a user's profile and plan"""
+    # promt format
+    if user_prefs.get('currentMeals'):
+        current_meals_text = "\n".join([
+            f"- {meal.get('type', 'Unknown')}: {meal.get('title', 'Unknown')} "
+            f"({meal.get('calories', 0):.0f} calories, {meal.get('protein', 0):.0f}g protein, "
+            f"{meal.get('carbs', 0):.0f}g carbs, {meal.get('fat', 0):.0f}g fat)"
+            for meal in user_prefs.get('currentMeals', [])
+        ])
+    else:
+        current_meals_text = "No current meal plan available"
 
-        recent_recipes_text = ', '.join(user_prefs.get('recentRecipes', [])) if user_prefs.get(
-            'recentRecipes') else 'No recent recipes available'
+    recent_recipes_text = ', '.join(user_prefs.get('recentRecipes', [])) if user_prefs.get(
+        'recentRecipes') else 'No recent recipes available'
 
-        prompt = f"""
+    return f"""
 I need personalized meal recommendations based on my dietary profile and current meal plan. Here are my details:
 Personal Information:
 - Height: {user_prefs.get('height', 'Not specified')} cm
@@ -578,30 +925,25 @@ Based on this information, please provide:
 4. Foods to Limit or Avoid: Based on my current plan and goal, what foods or eating patterns should I be mindful of?
 
 Please provide specific, actionable advice that I can implement immediately. Focus on practical suggestions rather than generic advice.
-        """
+    """
+
+
+@app.route('/api/generate-recommendations', methods=['POST'])
+@handle_errors
+def generate_recommendations():
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
 
-        # Try different model names in order of preference
-        model_names = [
-            'gemini-1.5-flash',
-            'gemini-1.5-pro',
-            'gemini-pro',
-            'models/gemini-pro',
-            'models/gemini-1.5-flash'
-        ]
+    if not GEMINI_API_KEY:
+        return jsonify({'error': 'Google Gemini API key not configured'}), 500
 
-        response = None
-        used_model = None
+    try:
+        prompt = recommendations_prompt(data.get('userPreferences', {}))
 
-        for model_name in model_names:
-            try:
-                model = genai.GenerativeModel(model_name)
-                response = model.generate_content(prompt)
-                used_model = model_name
-                break
-            except Exception as model_error:
-                continue
-
-        if not response:
+        try:
+            used_model, response = gemini.generate(prompt)
+        except GeminiUnavailableError:
             return jsonify({'error': 'No available AI models found. Please check your API key permissions.'}), 500
 
         if response.text:
@@ -616,6 +958,20 @@ Please provide specific, actionable advice that I can implement immediately. Foc
     except Exception as e:
         return jsonify({'error': f'Failed to generate recommendations: {str(e)}'}), 500
 
+
+@app.route('/api/generate-recommendations/stream', methods=['POST'])
+@handle_errors
+def generate_recommendations_stream():
+    """Recommendations streamed as Server-Sent Events while Gemini writes them"""
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    if not GEMINI_API_KEY:
+        return jsonify({'error': 'Google Gemini API key not configured'}), 500
+
+    return stream_gemini(recommendations_prompt(data.get('userPreferences', {})))
+
 # log user food preferences
 
 
@@ -665,52 +1021,225 @@ def make_api_request(endpoint, params=None):
     if not API_KEY:
         raise Exception("No API key configured")
 
-    params['apiKey'] = API_KEY
-    url = f"{BASE_URL}/{endpoint}"
+    return spoonacular.get_json(endpoint, params)
+
+
+# With a low budget, searches skip addRecipeNutrition. Zero minimums on the
+# macros still return their amounts in each result's nutrition, without the
+# extra points.
+CHEAP_NUTRITION_FILTERS = {'minCalories': 0, 'minProtein': 0, 'minCarbs': 0, 'minFat': 0}
+
 
+def with_nutrition(params):
+    """complexSearch params that return recipe nutrition, cheaply when the
+    Spoonacular budget is low"""
+    if spoonacular_quota.low():
+        return dict(CHEAP_NUTRITION_FILTERS, **params)
+    return dict(params, addRecipeNutrition=True)
+
+
+def complex_search(params):
+    """Run a (cached) complexSearch, with recipe nutrition, and add its
+    results to the recipe pool. The cache key leaves out the nutrition
+    params, so results cached before the budget ran low still hit after."""
+    def fetch():
+        results = spoonacular.get_json('recipes/complexSearch', with_nutrition(params))
+        recipe_pool.add_many(results.get('results', []))
+        return results
+    return search_cache.get_or_fetch(make_key('recipes/complexSearch', params), fetch)
+
+
+def parse_number(value):
+    """Float from a query-string value, or None if it is empty or invalid"""
     try:
-        response = requests.get(url, params=params, timeout=15)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
-    except Exception as e:
-        raise
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+# Numeric complexSearch filters passed through by recipe search
+RANGE_FILTERS = ('maxReadyTime', 'minCalories', 'maxCalories', 'minProtein', 'maxProtein')
 
 
 @app.route('/api/recipe-search', methods=['GET'])
 def search_recipes():
     """Search recipes with advanced filters"""
-    query = request.args.get('query', '')
-    diet = request.args.get('diet', '')
-    cuisine = request.args.get('cuisine', '')
-    max_ready_time = request.args.get('maxReadyTime', '')
+    query = normalize_text(request.args.get('query', ''))
+    diet = normalize_text(request.args.get('diet', ''))
+    cuisine = normalize_text(request.args.get('cuisine', ''))
 
     try:
         params = {
             'query': query,
-            'number': 10,
-            'addRecipeNutrition': True,
-            'apiKey': API_KEY
+            'number': 10
         }
 
         if diet:
             params['diet'] = diet
         if cuisine:
             params['cuisine'] = cuisine
-        if max_ready_time:
-            params['maxReadyTime'] = max_ready_time
+        ranges = {}
+        for name in RANGE_FILTERS:
+            value = request.args.get(name, '').strip()
+            if value:
+                params[name] = value
+                ranges[name] = parse_number(value)
+
+        # Answer from the local pool when it has a full page of matches, or
+        # any while the Spoonacular budget is low
+        if None not in ranges.values():
+            local = recipe_pool.query(
+                terms=query.split(),
+                diets=[d for d in diet.split(',') if d.strip()],
+                cuisines=[c.strip() for c in cuisine.split(',') if c.strip()],
+                max_ready_time=ranges.get('maxReadyTime'),
+                calories=(ranges.get('minCalories'), ranges.get('maxCalories')),
+                protein=(ranges.get('minProtein'), ranges.get('maxProtein')))
+            if len(local) >= params['number'] or (local and spoonacular_quota.low()):
+                recipe_pool.record(local=True)
+                return jsonify({
+                    'results': local[:params['number']],
+                    'offset': 0,
+                    'number': params['number'],
+                    'totalResults': len(local)
+                })
 
-        response = requests.get(
-            f'{BASE_URL}/recipes/complexSearch',
-            params=params
-        )
-        response.raise_for_status()
-        return jsonify(response.json())
+        recipe_pool.record(local=False)
+        return jsonify(complex_search(params))
     except requests.RequestException as e:
         return jsonify({'error': str(e)}), 500
 
 
+# Meal slots for a daily plan: (meal type, max ready time in minutes,
+# share of the day's calories)
+MEAL_SLOTS = [('breakfast', 30, 0.25), ('lunch', 45, 0.35), ('dinner', 60, 0.40)]
+
+# Full recipe information, cached on disk and fetched in batches via
+# informationBulk on a miss
+recipe_cache = RecipeCache(
+    os.getenv('RECIPE_CACHE_PATH', 'recipe_cache.db'),
+    ttl=float(os.getenv('RECIPE_CACHE_TTL', 24 * 3600)),
+    max_entries=int(os.getenv('RECIPE_CACHE_MAX_ENTRIES', 10000)))
+recipe_details = RecipeDetailService(
+    spoonacular, chunk_size=int(os.getenv('RECIPE_BULK_CHUNK_SIZE', 50)),
+    cache=recipe_cache)
+
+# Shared, bounded pool for fanning out per-slot Spoonacular calls
+meal_slot_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('MEAL_PLAN_WORKERS', 6)))
+MEAL_SLOT_TIMEOUT = float(os.getenv('MEAL_SLOT_TIMEOUT', 20))
+
+# Candidate recipes fetched per slot (Spoonacular returns at most 100), and
+# the plan horizon in days; clients that don't ask for `days` get one day
+MEAL_PLAN_POOL_SIZE = int(os.getenv('MEAL_PLAN_POOL_SIZE', 100))
+MEAL_PLAN_DEFAULT_DAYS = int(os.getenv('MEAL_PLAN_DEFAULT_DAYS', 1))
+MEAL_PLAN_MAX_DAYS = int(os.getenv('MEAL_PLAN_MAX_DAYS', 14))
+# Pool matches needed to plan a slot without searching upstream
+MEAL_PLAN_MIN_LOCAL = int(os.getenv('MEAL_PLAN_MIN_LOCAL', 50))
+# Lowest daily calorie target planned for, whatever height and weight say
+MEAL_PLAN_MIN_CALORIES = 1200
+
+EQUIPMENT_KEYWORDS = [
+    'oven', 'stove', 'pan', 'pot', 'bowl', 'whisk', 'spoon', 'knife',
+    'cutting board', 'baking sheet', 'muffin tin', 'blender', 'mixer',
+    'food processor', 'grater', 'measuring cup', 'measuring spoon'
+]
+
+
+def extract_equipment(detailed_recipe):
+    """Get recipe equipment, falling back to keywords found in the instructions"""
+    equipment_data = detailed_recipe.get('equipment', [])
+    if not equipment_data and detailed_recipe.get('instructions'):
+        instructions = detailed_recipe.get('instructions', '').lower()
+        equipment_data = [{'name': keyword.title()}
+                          for keyword in EQUIPMENT_KEYWORDS if keyword in instructions]
+        print(
+            f"Extracted equipment from instructions: {len(equipment_data)} items")
+    return equipment_data
+
+
+def search_meal_slot(meal_type, max_ready_time, slot_calories, restrictions):
+    """Fetch the candidate recipes for a meal slot that fit the restrictions"""
+    # Calorie bounds are rounded to 100 kcal so similar targets share a
+    # cached pool
+    params = {
+        'query': meal_type,
+        'number': MEAL_PLAN_POOL_SIZE,
+        'maxReadyTime': max_ready_time,
+        'minCalories': int(slot_calories * 0.5) // 100 * 100,
+        'maxCalories': (int(slot_calories * 1.5) // 100 + 1) * 100
+    }
+    params.update(restrictions.search_params())
+
+    # Plan from the local pool when it already has enough candidates (any,
+    # when the Spoonacular budget is low). Diets recipes aren't tagged with
+    # (keto) can only be filtered upstream.
+    min_local = 1 if spoonacular_quota.low() else MEAL_PLAN_MIN_LOCAL
+    candidates = []
+    if not restrictions.untagged_diets:
+        candidates = recipe_pool.query(
+            terms=[meal_type], max_ready_time=max_ready_time,
+            calories=(params['minCalories'], params['maxCalories']),
+            restrictions=restrictions)
+        if len(candidates) >= min_local:
+            recipe_pool.record(local=True)
+            print(f"{meal_type.title()}: {len(candidates)} candidate recipes (local)")
+            return candidates
+
+    # Otherwise widen the pool with a search and plan from both. Search
+    # results are checked too, in case the upstream filters missed anything.
+    recipe_pool.record(local=False)
+    results = [recipe for recipe in complex_search(params).get('results', [])
+               if restrictions.allows(recipe_diets(recipe) if 'diets' in recipe else None,
+                                      recipe_ingredients(recipe))]
+    candidates = list({recipe['id']: recipe
+                       for recipe in candidates + results}.values())
+    print(f"{meal_type.title()}: {len(candidates)} candidate recipes")
+    return candidates
+
+
+def liked_recipes(recipes, liked_foods):
+    """Which recipes use a food the user likes, by ingredient or title"""
+    return [bool(liked_foods & ingredient_words(
+        recipe_ingredients(recipe) | {normalize_text(recipe.get('title', ''))}))
+        for recipe in recipes]
+
+
+def fetch_recipe_details(recipe_ids):
+    """Full information for recipes, also refreshing their pool entries"""
+    details = recipe_details.get_many(recipe_ids)
+    recipe_pool.add_many(details.values(), refresh_only=True)
+    return details
+
+
+def build_meal(meal_type, meal, detailed_recipe):
+    """Combine a search result and its full recipe information into a plan meal"""
+    facts = parse_nutrition(meal.get('nutrition'))
+
+    return {
+        'type': meal_type,
+        'title': meal['title'],
+        'image': meal['image'],
+        'calories': facts.calories or 0,
+        'protein': facts.protein or 0,
+        'carbs': facts.carbs or 0,
+        'fat': facts.fat or 0,
+        'readyInMinutes': meal.get('readyInMinutes', 0),
+        'servings': meal.get('servings', 1),
+        'instructions': detailed_recipe.get('instructions', ''),
+        'ingredients': detailed_recipe.get('extendedIngredients', []),
+        'equipment': extract_equipment(detailed_recipe),
+        'summary': detailed_recipe.get('summary', ''),
+        'cuisines': meal.get('cuisines', []),
+        'diets': meal.get('diets', []),
+        'sourceUrl': detailed_recipe.get('sourceUrl', ''),
+        'sourceName': detailed_recipe.get('sourceName', ''),
+        'pricePerServing': detailed_recipe.get('pricePerServing', 0),
+        'healthScore': detailed_recipe.get('healthScore', 0),
+        'spoonacularScore': detailed_recipe.get('spoonacularScore', 0)
+    }
+
+
 @app.route('/api/generate-meal-plan', methods=['POST'])
 def generate_meal_plan():
     print("Received request for meal plan generation")
@@ -725,6 +1254,8 @@ def generate_meal_plan():
     goal = data.get('goal', 'maintain')
     restrictions = data.get('restrictions', '')
     foods = data.get('foods', '')
+    if isinstance(restrictions, dict) or isinstance(foods, dict):
+        return jsonify({'error': 'restrictions and foods must be text or lists'}), 400
 
     # Convert to integers for calculations
     try:
@@ -747,287 +1278,95 @@ def generate_meal_plan():
             daily_calories = bmr  # maintain
     else:
         daily_calories = 2000  # default
+    daily_calories = max(daily_calories, MEAL_PLAN_MIN_CALORIES)
 
     try:
-        # Search for breakfast recipes
-        breakfast_response = requests.get(
-            f'{BASE_URL}/recipes/complexSearch',
-            params={
-                'query': 'breakfast',
-                'number': 1,
-                'addRecipeNutrition': True,
-                'maxReadyTime': 30,
-                'apiKey': API_KEY
-            }
-        )
-        print(
-            f"Breakfast API Response Status: {breakfast_response.status_code}")
-
-        # Search for lunch recipes
-        lunch_response = requests.get(
-            f'{BASE_URL}/recipes/complexSearch',
-            params={
-                'query': 'lunch',
-                'number': 1,
-                'addRecipeNutrition': True,
-                'maxReadyTime': 45,
-                'apiKey': API_KEY
-            }
-        )
-        print(f"Lunch API Response Status: {lunch_response.status_code}")
-
-        # Search for dinner recipes
-        dinner_response = requests.get(
-            f'{BASE_URL}/recipes/complexSearch',
-            params={
-                'query': 'dinner',
-                'number': 1,
-                'addRecipeNutrition': True,
-                'maxReadyTime': 60,
-                'apiKey': API_KEY
-            }
-        )
-        print(f"Dinner API Response Status: {dinner_response.status_code}")
-
-        enhanced_meals = []
-
-        # Process breakfast
-        if breakfast_response.ok:
-            breakfast_data = breakfast_response.json()
-            if breakfast_data.get('results'):
-                meal = breakfast_data['results'][0]
-
-                # Get detailed recipe information
-                recipe_id = meal['id']
-                detailed_response = requests.get(
-                    f'{BASE_URL}/recipes/{recipe_id}/information',
-                    params={'apiKey': API_KEY}
-                )
-
-                detailed_recipe = {}
-                if detailed_response.ok:
-                    detailed_recipe = detailed_response.json()
-                    print(
-                        f"Detailed breakfast recipe fetched: {detailed_recipe.get('title', 'Unknown')}")
-
-                # Try to get equipment from a different endpoint or extract from instructions
-                equipment_data = detailed_recipe.get('equipment', [])
-                if not equipment_data and detailed_recipe.get('instructions'):
-                    # Extract common equipment from instructions
-                    instructions = detailed_recipe.get(
-                        'instructions', '').lower()
-                    common_equipment = []
-
-                    equipment_keywords = [
-                        'oven', 'stove', 'pan', 'pot', 'bowl', 'whisk', 'spoon', 'knife',
-                        'cutting board', 'baking sheet', 'muffin tin', 'blender', 'mixer',
-                        'food processor', 'grater', 'measuring cup', 'measuring spoon'
-                    ]
-
-                    for keyword in equipment_keywords:
-                        if keyword in instructions:
-                            common_equipment.append({'name': keyword.title()})
-
-                    equipment_data = common_equipment
-                    print(
-                        f"Extracted equipment from instructions: {len(equipment_data)} items")
-
-                # Extract nutrition information properly
-                nutrition = meal.get('nutrition', {})
-                nutrients = nutrition.get('nutrients', [])
-
-                # Find specific nutrients
-                calories = next(
-                    (n for n in nutrients if n['name'] == 'Calories'), None)
-                protein = next(
-                    (n for n in nutrients if n['name'] == 'Protein'), None)
-                carbs = next(
-                    (n for n in nutrients if n['name'] == 'Carbohydrates'), None)
-                fat = next((n for n in nutrients if n['name'] == 'Fat'), None)
-
-                enhanced_meals.append({
-                    'type': 'breakfast',
-                    'title': meal['title'],
-                    'image': meal['image'],
-                    'calories': calories['amount'] if calories else 0,
-                    'protein': protein['amount'] if protein else 0,
-                    'carbs': carbs['amount'] if carbs else 0,
-                    'fat': fat['amount'] if fat else 0,
-                    'readyInMinutes': meal.get('readyInMinutes', 0),
-                    'servings': meal.get('servings', 1),
-                    'instructions': detailed_recipe.get('instructions', ''),
-                    'ingredients': detailed_recipe.get('extendedIngredients', []),
-                    'equipment': equipment_data,
-                    'summary': detailed_recipe.get('summary', ''),
-                    'cuisines': meal.get('cuisines', []),
-                    'diets': meal.get('diets', []),
-                    'sourceUrl': detailed_recipe.get('sourceUrl', ''),
-                    'sourceName': detailed_recipe.get('sourceName', ''),
-                    'pricePerServing': detailed_recipe.get('pricePerServing', 0),
-                    'healthScore': detailed_recipe.get('healthScore', 0),
-                    'spoonacularScore': detailed_recipe.get('spoonacularScore', 0)
-                })
-
-        # Process lunch
-        if lunch_response.ok:
-            lunch_data = lunch_response.json()
-            if lunch_data.get('results'):
-                meal = lunch_data['results'][0]
-
-                # Get detailed recipe information
-                recipe_id = meal['id']
-                detailed_response = requests.get(
-                    f'{BASE_URL}/recipes/{recipe_id}/information',
-                    params={'apiKey': API_KEY}
-                )
-
-                detailed_recipe = {}
-                if detailed_response.ok:
-                    detailed_recipe = detailed_response.json()
-                    print(
-                        f"Detailed lunch recipe fetched: {detailed_recipe.get('title', 'Unknown')}")
-
-                # Try to get equipment from a different endpoint or extract from instructions
-                equipment_data = detailed_recipe.get('equipment', [])
-                if not equipment_data and detailed_recipe.get('instructions'):
-                    # Extract common equipment from instructions
-                    instructions = detailed_recipe.get(
-                        'instructions', '').lower()
-                    common_equipment = []
-
-                    equipment_keywords = [
-                        'oven', 'stove', 'pan', 'pot', 'bowl', 'whisk', 'spoon', 'knife',
-                        'cutting board', 'baking sheet', 'muffin tin', 'blender', 'mixer',
-                        'food processor', 'grater', 'measuring cup', 'measuring spoon'
-                    ]
-
-                    for keyword in equipment_keywords:
-                        if keyword in instructions:
-                            common_equipment.append({'name': keyword.title()})
-
-                    equipment_data = common_equipment
-                    print(
-                        f"Extracted equipment from instructions: {len(equipment_data)} items")
-
-                # Extract nutrition information properly
-                nutrition = meal.get('nutrition', {})
-                nutrients = nutrition.get('nutrients', [])
-
-                # Find specific nutrients
-                calories = next(
-                    (n for n in nutrients if n['name'] == 'Calories'), None)
-                protein = next(
-                    (n for n in nutrients if n['name'] == 'Protein'), None)
-                carbs = next(
-                    (n for n in nutrients if n['name'] == 'Carbohydrates'), None)
-                fat = next((n for n in nutrients if n['name'] == 'Fat'), None)
-
-                enhanced_meals.append({
-                    'type': 'lunch',
-                    'title': meal['title'],
-                    'image': meal['image'],
-                    'calories': calories['amount'] if calories else 0,
-                    'protein': protein['amount'] if protein else 0,
-                    'carbs': carbs['amount'] if carbs else 0,
-                    'fat': fat['amount'] if fat else 0,
-                    'readyInMinutes': meal.get('readyInMinutes', 0),
-                    'servings': meal.get('servings', 1),
-                    'instructions': detailed_recipe.get('instructions', ''),
-                    'ingredients': detailed_recipe.get('extendedIngredients', []),
-                    'equipment': equipment_data,
-                    'summary': detailed_recipe.get('summary', ''),
-                    'cuisines': meal.get('cuisines', []),
-                    'diets': meal.get('diets', []),
-                    'sourceUrl': detailed_recipe.get('sourceUrl', ''),
-                    'sourceName': detailed_recipe.get('sourceName', ''),
-                    'pricePerServing': detailed_recipe.get('pricePerServing', 0),
-                    'healthScore': detailed_recipe.get('healthScore', 0),
-                    'spoonacularScore': detailed_recipe.get('spoonacularScore', 0)
-                })
-
-        # Process dinner
-        if dinner_response.ok:
-            dinner_data = dinner_response.json()
-            if dinner_data.get('results'):
-                meal = dinner_data['results'][0]
-
-                # Get detailed recipe information
-                recipe_id = meal['id']
-                detailed_response = requests.get(
-                    f'{BASE_URL}/recipes/{recipe_id}/information',
-                    params={'apiKey': API_KEY}
-                )
-
-                detailed_recipe = {}
-                if detailed_response.ok:
-                    detailed_recipe = detailed_response.json()
-                    print(
-                        f"Detailed dinner recipe fetched: {detailed_recipe.get('title', 'Unknown')}")
-
-                # Try to get equipment from a different endpoint or extract from instructions
-                equipment_data = detailed_recipe.get('equipment', [])
-                if not equipment_data and detailed_recipe.get('instructions'):
-                    # Extract common equipment from instructions
-                    instructions = detailed_recipe.get(
-                        'instructions', '').lower()
-                    common_equipment = []
-
-                    equipment_keywords = [
-                        'oven', 'stove', 'pan', 'pot', 'bowl', 'whisk', 'spoon', 'knife',
-                        'cutting board', 'baking sheet', 'muffin tin', 'blender', 'mixer',
-                        'food processor', 'grater', 'measuring cup', 'measuring spoon'
-                    ]
-
-                    for keyword in equipment_keywords:
-                        if keyword in instructions:
-                            common_equipment.append({'name': keyword.title()})
-
-                    equipment_data = common_equipment
-                    print(
-                        f"Extracted equipment from instructions: {len(equipment_data)} items")
-
-                # Extract nutrition information properly
-                nutrition = meal.get('nutrition', {})
-                nutrients = nutrition.get('nutrients', [])
-
-                # Find specific nutrients
-                calories = next(
-                    (n for n in nutrients if n['name'] == 'Calories'), None)
-                protein = next(
-                    (n for n in nutrients if n['name'] == 'Protein'), None)
-                carbs = next(
-                    (n for n in nutrients if n['name'] == 'Carbohydrates'), None)
-                fat = next((n for n in nutrients if n['name'] == 'Fat'), None)
-
-                enhanced_meals.append({
-                    'type': 'dinner',
-                    'title': meal['title'],
-                    'image': meal['image'],
-                    'calories': calories['amount'] if calories else 0,
-                    'protein': protein['amount'] if protein else 0,
-                    'carbs': carbs['amount'] if carbs else 0,
-                    'fat': fat['amount'] if fat else 0,
-                    'readyInMinutes': meal.get('readyInMinutes', 0),
-                    'servings': meal.get('servings', 1),
-                    'instructions': detailed_recipe.get('instructions', ''),
-                    'ingredients': detailed_recipe.get('extendedIngredients', []),
-                    'equipment': equipment_data,
-                    'summary': detailed_recipe.get('summary', ''),
-                    'cuisines': meal.get('cuisines', []),
-                    'diets': meal.get('diets', []),
-                    'sourceUrl': detailed_recipe.get('sourceUrl', ''),
-                    'sourceName': detailed_recipe.get('sourceName', ''),
-                    'pricePerServing': detailed_recipe.get('pricePerServing', 0),
-                    'healthScore': detailed_recipe.get('healthScore', 0),
-                    'spoonacularScore': detailed_recipe.get('spoonacularScore', 0)
-                })
+        days = int(data.get('days', MEAL_PLAN_DEFAULT_DAYS))
+    except (ValueError, TypeError):
+        days = MEAL_PLAN_DEFAULT_DAYS
+    days = max(1, min(days, MEAL_PLAN_MAX_DAYS))
+
+    # Restrictions filter candidates before any detail fetch; liked foods
+    # only break ties between similarly fitting meals
+    profile = compile_restrictions(restrictions)
+    liked_foods = parse_liked_foods(foods)
+    degraded = spoonacular_quota.low()
+    user = spoonacular_quota.current_user()
+
+    def slot_search(meal_type, max_ready_time, share):
+        # Runs on an executor thread: ahead of background upstream calls,
+        # charged to the requesting user
+        with priority(INTERACTIVE), spoonacular_quota.attribute(user):
+            return search_meal_slot(meal_type, max_ready_time,
+                                    daily_calories * share, profile)
 
-        print(f"Enhanced meals: {enhanced_meals}")
+    try:
+        # Fetch every slot's candidate pool concurrently
+        futures = [meal_slot_executor.submit(slot_search, meal_type, max_ready_time, share)
+                   for meal_type, max_ready_time, share in MEAL_SLOTS]
+        done, not_done = wait(futures, timeout=MEAL_SLOT_TIMEOUT)
+
+        slot_pools = []
+        for (meal_type, _, _), future in zip(MEAL_SLOTS, futures):
+            candidates = []
+            if future in not_done:
+                print(f"{meal_type.title()} timed out after {MEAL_SLOT_TIMEOUT}s")
+                future.cancel()
+            else:
+                try:
+                    candidates = future.result()
+                except requests.RequestException as e:
+                    print(f"{meal_type.title()} request error: {e}")
+            slot_pools.append(candidates)
+
+        # Pick meals for the whole horizon from the pools
+        targets = daily_targets(daily_calories)
+        choice, day_errors = plan_meals(
+            [nutrient_matrix(pool) for pool in slot_pools],
+            [[recipe['id'] for recipe in pool] for pool in slot_pools],
+            days, targets, [share for _, _, share in MEAL_SLOTS],
+            slot_preferred=[liked_recipes(pool, liked_foods) for pool in slot_pools]
+            if liked_foods else None)
+        plan = []
+        for day in range(days):
+            plan.append([(meal_type, slot_pools[slot][choice[day, slot]])
+                         for slot, (meal_type, _, _) in enumerate(MEAL_SLOTS)
+                         if choice[day, slot] >= 0])
+
+        # Fetch full information for every chosen recipe in one bulk call;
+        # on a low budget, only what is already cached
+        chosen = {meal['id'] for day_meals in plan for _, meal in day_meals}
+        try:
+            with priority(INTERACTIVE):
+                details = recipe_cache.get_many(chosen) if degraded \
+                    else fetch_recipe_details(chosen)
+        except requests.RequestException as e:
+            # Still return the meals from the search results
+            print(f"Recipe detail fetch failed: {e}")
+            details = {}
+
+        plan_days = []
+        for day, day_meals in enumerate(plan):
+            meals = [build_meal(meal_type, meal, details.get(meal['id'], {}))
+                     for meal_type, meal in day_meals]
+            plan_days.append({
+                'day': day + 1,
+                'meals': meals,
+                'totals': {field: round(sum(meal[field] for meal in meals), 1)
+                           for field in ('calories', 'protein', 'carbs', 'fat')}
+            })
+        print(f"Planned {days} days, mean error {day_errors.mean():.4f}")
 
         return jsonify({
             'daily_calories': int(daily_calories),
             'goal': goal,
-            'meals': enhanced_meals,
+            # Details may be missing while the Spoonacular budget is low
+            'degraded': degraded,
+            'targets': dict(zip(('calories', 'protein', 'carbs', 'fat'),
+                                (round(float(value), 1) for value in targets))),
+            # The first day, as returned before multi-day plans
+            'meals': plan_days[0]['meals'],
+            'days': plan_days,
             'user_preferences': {
                 'height': height,
                 'weight': weight,
@@ -1045,13 +1384,12 @@ def generate_meal_plan():
 def get_meal_plan_templates():
     """Get available meal plan templates (vegetarian, keto, etc.)"""
     try:
-        response = requests.get(
-            f'{BASE_URL}/mealplanner/generate',
+        response = spoonacular.get(
+            'mealplanner/generate',
             params={
                 'timeFrame': 'week',
                 'targetCalories': 2000,
-                'diet': 'vegetarian',
-                'apiKey': API_KEY
+                'diet': 'vegetarian'
             }
         )
         response.raise_for_status()
@@ -1084,12 +1422,13 @@ def get_recipes_by_ingredients():
         ingredients_list.append(search_entry)
 
     params = {
-        'ingredients': ingredients,
+        'ingredients': normalize_ingredients(ingredients),
         'number': 5,
-        'ranking': 1,
-        'apiKey': API_KEY
+        'ranking': 1
     }
-    recipes = make_api_request('recipes/findByIngredients', params)
+    recipes = search_cache.get_or_fetch(
+        make_key('recipes/findByIngredients', params),
+        lambda: make_api_request('recipes/findByIngredients', dict(params)))
     return jsonify(recipes)
 
 
@@ -1117,7 +1456,19 @@ def save_recipe():
 
 @app.route('/api/saved-recipes', methods=['GET'])
 def get_saved_recipes():
-    return jsonify(sorted(saved_recipes, key=lambda x: x['saved_at'], reverse=True))
+    recipes = sorted(saved_recipes, key=lambda x: x['saved_at'], reverse=True)
+
+    # ?details=true adds full recipe information, fetched in one bulk call
+    if request.args.get('details', '').lower() == 'true' and recipes:
+        try:
+            details = fetch_recipe_details(recipe['id'] for recipe in recipes)
+        except requests.RequestException as e:
+            return jsonify({'error': str(e)}), 500
+        # Recipes saved with non-numeric ids get no details
+        recipes = [dict(recipe, details=details.get(recipe_id_int(recipe['id'])))
+                   for recipe in recipes]
+
+    return jsonify(recipes)
 
 
 @app.route('/api/delete-recipe/<int:recipe_id>', methods=['DELETE'])
@@ -1140,7 +1491,29 @@ def health_check():
         'gemini_api_key_preview': GEMINI_API_KEY[:10] + '...' if GEMINI_API_KEY else 'Not configured',
         'saved_recipes_count': len(saved_recipes),
         'ingredient_searches_count': len(ingredients_list),
-        'food_preferences_count': len(user_food_preferences)
+        'food_preferences_count': len(user_food_preferences),
+        'user_cache': user_store.cache.stats(),
+        'user_store_group_commit': user_store.group_commit_stats(),
+        'password_hashing': password_hasher.stats(),
+        'sessions': session_store.stats(),
+        'recipe_cache': recipe_cache.stats(),
+        'search_cache': search_cache.stats(),
+        'recipe_pool': recipe_pool.stats(),
+        'ingredient_table': ingredient_db.stats(),
+        'single_flight': {
+            'spoonacular': spoonacular.flights.stats(),
+            'gemini': gemini.flights.stats()
+        },
+        'spoonacular_quota': spoonacular_quota.stats(),
+        'upstream_schedulers': {
+            'spoonacular': spoonacular_scheduler.stats(),
+            'gemini': gemini_scheduler.stats()
+        },
+        'gemini_models': gemini.stats(),
+        'gemini_cache': {
+            'chatbot': chat_cache.stats(),
+            'nutrition': nutrition_prompt_cache.stats()
+        }
     })
 
 
@@ -1149,6 +1522,8 @@ def home():
     return "Welcome to the Meal Planner API!"
 
 
+# Development server; production runs wsgi:app under gunicorn (see Procfile)
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
-app.run(debug=True, host='0.0.0.0', port=port)
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', host='0.0.0.0',
+            port=port, threaded=True)
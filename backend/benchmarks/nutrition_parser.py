@@ -0,0 +1,63 @@
+"""Compare the single-pass nutrition parser with the per-macro next(...) scans
+it replaced, on Spoonacular-sized nutrient lists.
+
+Run from the backend directory: python benchmarks/nutrition_parser.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nutrition_parser import parse_nutrition  # noqa: E402
+
+# Spoonacular's full nutrient list has ~35 entries; Fat comes early and
+# Protein/Carbohydrates are spread through it
+FILLER = ['Saturated Fat', 'Sugar', 'Cholesterol', 'Sodium', 'Alcohol',
+          'Fiber', 'Vitamin C', 'Manganese', 'Potassium', 'Magnesium',
+          'Vitamin B6', 'Iron', 'Copper', 'Phosphorus', 'Zinc', 'Calcium',
+          'Vitamin B1', 'Folate', 'Vitamin B3', 'Vitamin K', 'Selenium',
+          'Vitamin E', 'Vitamin A', 'Vitamin B2', 'Vitamin B5', 'Vitamin B12',
+          'Vitamin D', 'Choline', 'Net Carbohydrates', 'Caffeine']
+
+
+def make_recipe(i):
+    names = ['Calories', 'Fat'] + FILLER[:10] + ['Carbohydrates'] + \
+        FILLER[10:20] + ['Protein'] + FILLER[20:]
+    return {'id': i, 'nutrition': {'nutrients': [
+        {'name': name, 'amount': float(i + k), 'unit': 'g'}
+        for k, name in enumerate(names)]}}
+
+
+def parse_with_next(nutrition):
+    """The lookups previously copy-pasted across generate_meal_plan and
+    estimate_nutrition"""
+    nutrients = nutrition.get('nutrients', [])
+    calories = next((n for n in nutrients if n['name'] == 'Calories'), None)
+    protein = next((n for n in nutrients if n['name'] == 'Protein'), None)
+    carbs = next((n for n in nutrients if n['name'] == 'Carbohydrates'), None)
+    fat = next((n for n in nutrients if n['name'] == 'Fat'), None)
+    return (calories['amount'] if calories else 0,
+            protein['amount'] if protein else 0,
+            carbs['amount'] if carbs else 0,
+            fat['amount'] if fat else 0)
+
+
+def main():
+    for recipe_count in (3, 21, 100):
+        recipes = [make_recipe(i) for i in range(recipe_count)]
+        for recipe in recipes:
+            assert parse_with_next(recipe['nutrition']) == \
+                parse_nutrition(recipe['nutrition']).as_tuple()
+
+        runs = 2000
+        old = timeit.timeit(
+            lambda: [parse_with_next(r['nutrition']) for r in recipes], number=runs)
+        new = timeit.timeit(
+            lambda: [parse_nutrition(r['nutrition']) for r in recipes], number=runs)
+        print(f"{recipe_count:>4} recipes: next() scans {old / runs * 1e6:8.1f} us, "
+              f"single pass {new / runs * 1e6:8.1f} us ({old / new:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Login throughput at each scrypt cost setting, hashing in the password
+worker processes (as the app does) and, for comparison, inline in the
+request threads.
+
+Run from the backend directory: python benchmarks/password_hashing.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, check_password, hash_password  # noqa: E402
+
+COSTS = (2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15)
+# Concurrent logins, like request threads during a login storm
+CLIENTS = 16
+SECONDS = 3
+
+
+def storm(login):
+    """Run login() from CLIENTS threads for SECONDS; returns (logins/s,
+    median ms, p95 ms)"""
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + SECONDS
+
+    def client():
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            login()
+            with lock:
+                latencies.append(time.monotonic() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    return (len(latencies) / elapsed,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+
+def main():
+    print(f"{os.cpu_count()} CPUs, {CLIENTS} concurrent logins, {SECONDS}s per run")
+    for n in COSTS:
+        stored = hash_password('correct horse', n=n)
+        hasher = PasswordHasher(n=n)
+        # Start the pool's processes before timing
+        hasher.check('correct horse', stored)
+
+        start = time.monotonic()
+        check_password('correct horse', stored, n=n)
+        single = (time.monotonic() - start) * 1000
+
+        pooled = storm(lambda: hasher.check('correct horse', stored))
+        inline = storm(lambda: check_password('correct horse', stored, n=n))
+        hasher.shutdown()
+        print(f"n={n:>6} ({single:6.1f} ms/hash): "
+              f"pool {pooled[0]:7.1f} logins/s (p50 {pooled[1]:7.1f} ms, p95 {pooled[2]:7.1f} ms), "
+              f"inline {inline[0]:7.1f} logins/s (p50 {inline[1]:7.1f} ms, p95 {inline[2]:7.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import itertools
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from rate_limit import UpstreamBusyError
+from single_flight import SingleFlight
+
+# Gemini model manager. Model handles are created once per name and reused.
+# Models that fail are skipped for a cooldown window, so requests go straight
+# to the first model that is currently working instead of retrying every
+# name in turn. With a scheduler, each call waits for a rate-limited slot
+# (see rate_limit.py); a stream holds its slot until it is consumed.
+
+# Models tried in order of preference
+DEFAULT_MODELS = (
+    'gemini-1.5-flash',
+    'gemini-1.5-pro',
+    'gemini-pro',
+    'models/gemini-pro',
+    'models/gemini-1.5-flash'
+)
+
+# Errors meaning the model name itself is unusable with this key, as opposed
+# to a transient failure (rate limit, timeout, server error)
+UNAVAILABLE_ERRORS = (google_exceptions.NotFound,
+                      google_exceptions.PermissionDenied)
+
+
+class GeminiUnavailableError(Exception):
+    """No configured Gemini model could handle the request"""
+
+
+class _TextStream:
+    """Text of streamed chunks; calls release() once when the stream ends,
+    fails or is closed. Callers that may stop early must close() it."""
+
+    def __init__(self, chunks, release=None):
+        self._chunks = chunks
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            while True:
+                text = next(self._chunks).text
+                if text:
+                    return text
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class GeminiModels:
+    def __init__(self, model_names=DEFAULT_MODELS, cooldown=60,
+                 unavailable_cooldown=3600, scheduler=None):
+        self.scheduler = scheduler
+        self.model_names = list(model_names)
+        self.cooldown = cooldown
+        self.unavailable_cooldown = unavailable_cooldown
+        self._models = {}
+        self._skip_until = {}
+        self._lock = threading.Lock()
+        # Identical concurrent prompts share one generate_content call
+        self.flights = SingleFlight()
+        self.calls = {name: 0 for name in self.model_names}
+        self.failures = {name: 0 for name in self.model_names}
+        self.fallbacks = 0
+
+    def model(self, name):
+        """The GenerativeModel handle for a name, created on first use"""
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                model = self._models[name] = genai.GenerativeModel(name)
+            return model
+
+    def _candidates(self):
+        """Model names to try: those not cooling down, in preference order.
+        If every model is cooling down, all of them, soonest-back first."""
+        now = time.monotonic()
+        with self._lock:
+            ready = [name for name in self.model_names
+                     if self._skip_until.get(name, 0) <= now]
+            if ready:
+                return ready
+            return sorted(self.model_names, key=lambda name: self._skip_until[name])
+
+    def _failed(self, name, error):
+        unavailable = isinstance(error, UNAVAILABLE_ERRORS)
+        window = self.unavailable_cooldown if unavailable else self.cooldown
+        with self._lock:
+            self._skip_until[name] = time.monotonic() + window
+            self.failures[name] = self.failures.get(name, 0) + 1
+        print(f"Gemini model {name} failed, skipping it for {window}s: {error}")
+
+    def _succeeded(self, name, attempt):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self._skip_until.pop(name, None)
+            if attempt:
+                self.fallbacks += 1
+
+    def _call(self, fn):
+        if self.scheduler is None:
+            return fn()
+        return self.scheduler.run(fn)
+
+    def generate(self, prompt):
+        """Generate content with the first working model.
+
+        Returns (model name, response); raises GeminiUnavailableError with
+        the last error if every model fails.
+        """
+        last_error = None
+        for attempt, name in enumerate(self._candidates()):
+            try:
+                response = self.flights.do((name, prompt), lambda: self._call(
+                    lambda: self.model(name).generate_content(prompt)))
+            except UpstreamBusyError as e:
+                # Our own limit, not a model failure
+                raise GeminiUnavailableError(str(e)) from e
+            except Exception as e:
+                self._failed(name, e)
+                last_error = e
+                continue
+            self._succeeded(name, attempt)
+            return name, response
+        raise GeminiUnavailableError(str(last_error))
+
+    def stream(self, prompt):
+        """Stream content from the first working model.
+
+        Returns (model name, iterator of text pieces). A model that fails
+        before its first chunk is skipped as in generate(); later errors are
+        raised by the iterator.
+        """
+        last_error = None
+        for attempt, name in enumerate(self._candidates()):
+            if self.scheduler is not None:
+                try:
+                    self.scheduler.acquire()
+                except UpstreamBusyError as e:
+                    raise GeminiUnavailableError(str(e)) from e
+            try:
+                chunks = iter(self.model(name).generate_content(prompt, stream=True))
+                first = next(chunks, None)
+            except Exception as e:
+                if self.scheduler is not None:
+                    self.scheduler.release()
+                self._failed(name, e)
+                last_error = e
+                continue
+            self._succeeded(name, attempt)
+            head = [first] if first is not None else []
+            return name, _TextStream(itertools.chain(head, chunks),
+                                     self.scheduler and self.scheduler.release)
+        raise GeminiUnavailableError(str(last_error))
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'models': {
+                    name: {
+                        'calls': self.calls.get(name, 0),
+                        'failures': self.failures.get(name, 0),
+                        'cooldown_remaining': max(0, round(self._skip_until.get(name, 0) - now))
+                    }
+                    for name in self.model_names
+                },
+                'fallbacks': self.fallbacks
+            }
@@ -0,0 +1,23 @@
+import os
+
+# Production server settings: `gunicorn --config gunicorn.conf.py wsgi:app`.
+# Requests spend most of their time waiting on Spoonacular and Gemini, so
+# each worker runs many threads; the shared HTTP pools, caches and thread
+# pools in app.py are per worker process.
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+
+# Saved recipes, ingredient history and food preferences are still kept in
+# process memory, so they are only consistent with a single worker. User
+# data, sessions and the caches backed by SQLite work across workers.
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 128))
+
+# Meal plans and Gemini calls can take a while
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
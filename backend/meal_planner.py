@@ -0,0 +1,149 @@
+import numpy as np
+
+from nutrition_parser import parse_nutrition
+
+# Multi-day meal plan solver. Each meal slot has a pool of candidate recipes;
+# the solver picks one recipe per slot per day so that every day's calories
+# and macros land close to the daily targets, without repeating a recipe
+# while unused candidates remain.
+#
+# It runs a greedy pass (each slot picks the candidate that best completes
+# the day, assuming the remaining slots hit their share of the target) and
+# then repair rounds that swap single meals while that lowers the day's
+# error. Candidate scoring is vectorized over the whole pool, so a week with
+# hundreds of candidates per slot takes a few milliseconds.
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+
+# Share of daily calories from each macro, and kcal per gram
+MACRO_SPLIT = {'protein': 0.30, 'carbs': 0.40, 'fat': 0.30}
+KCAL_PER_GRAM = {'protein': 4, 'carbs': 4, 'fat': 9}
+
+# How much a relative miss on each nutrient counts; calories matter most
+NUTRIENT_WEIGHTS = np.array([1.0, 0.5, 0.25, 0.25])
+
+MAX_REPAIR_ROUNDS = 4
+
+# Error credited to a candidate the user would prefer (e.g. it uses foods
+# they like); about what a 7% calorie miss costs
+PREFERENCE_BONUS = 0.005
+
+
+def daily_targets(daily_calories):
+    """Daily calories and grams of protein, carbs and fat as a NumPy array"""
+    return np.array([daily_calories] + [
+        daily_calories * MACRO_SPLIT[macro] / KCAL_PER_GRAM[macro]
+        for macro in NUTRIENTS[1:]])
+
+
+def nutrient_matrix(recipes):
+    """Candidates x (calories, protein, carbs, fat) for complexSearch results"""
+    matrix = np.zeros((len(recipes), len(NUTRIENTS)))
+    for i, recipe in enumerate(recipes):
+        matrix[i] = parse_nutrition(recipe.get('nutrition')).as_tuple()
+    return matrix
+
+
+def _errors(totals, target):
+    """Weighted squared relative error of one or many daily totals; zero
+    targets count absolute error"""
+    scale = np.where(target > 0, target, 1)
+    return (((totals - target) / scale) ** 2 * NUTRIENT_WEIGHTS).sum(axis=-1)
+
+
+class _Pools:
+    """Candidate ids per slot and how often each recipe is used in the plan"""
+
+    def __init__(self, slot_ids):
+        self.ids = [np.asarray(ids) for ids in slot_ids]
+        # Map each slot's rows onto one array of distinct recipes, so a recipe
+        # offered for two slots counts as used in both
+        all_ids = np.concatenate(self.ids) if self.ids else np.array([])
+        distinct, inverse = np.unique(all_ids, return_inverse=True)
+        bounds = np.cumsum([0] + [len(ids) for ids in self.ids])
+        self.rows = [inverse[bounds[s]:bounds[s + 1]] for s in range(len(self.ids))]
+        self.uses = np.zeros(len(distinct), dtype=int)
+
+    def available(self, slot, keep=None):
+        """Mask of the slot's candidates that can be picked without a repeat.
+
+        `keep` is the row currently in the slot, which may stay. When every
+        candidate is taken the least-used ones are allowed again.
+        """
+        uses = self.uses[self.rows[slot]]
+        if keep is not None:
+            uses = uses.copy()
+            uses[keep] -= 1
+        return uses == uses.min()
+
+    def take(self, slot, row):
+        self.uses[self.rows[slot][row]] += 1
+
+    def release(self, slot, row):
+        self.uses[self.rows[slot][row]] -= 1
+
+
+def plan_meals(slot_matrices, slot_ids, days, target, slot_shares,
+               slot_preferred=None):
+    """Pick one candidate per slot for each day.
+
+    `slot_matrices[s]` is a (candidates, 4) nutrient matrix for slot s and
+    `slot_ids[s]` the recipe ids of its rows; `target` comes from
+    daily_targets() and `slot_shares[s]` is the slot's share of it.
+    `slot_preferred[s]`, if given, is a boolean array marking candidates to
+    favour when they fit about as well as the others. Returns a
+    (days, slots) array of row indices, -1 where a slot has no candidates,
+    and the per-day error.
+    """
+    slots = len(slot_matrices)
+    pools = _Pools(slot_ids)
+    shares = np.asarray(slot_shares, dtype=float)
+    shares = shares / shares.sum()
+    choice = np.full((days, slots), -1, dtype=int)
+    bonus = [PREFERENCE_BONUS * np.asarray(preferred, dtype=float)
+             for preferred in slot_preferred] if slot_preferred else \
+        [0.0] * slots
+
+    def day_totals(day, skip=None):
+        totals = np.zeros(len(NUTRIENTS))
+        for slot in range(slots):
+            if slot != skip and choice[day, slot] >= 0:
+                totals += slot_matrices[slot][choice[day, slot]]
+        return totals
+
+    # Greedy: fill slots in order, assuming later slots hit their share
+    for day in range(days):
+        for slot in range(slots):
+            if not len(slot_matrices[slot]):
+                continue
+            expected_rest = target * shares[slot + 1:].sum()
+            errors = _errors(day_totals(day) + expected_rest +
+                             slot_matrices[slot], target) - bonus[slot]
+            errors[~pools.available(slot)] = np.inf
+            best = int(np.argmin(errors))
+            choice[day, slot] = best
+            pools.take(slot, best)
+
+    # Repair: swap single meals while that lowers the day's error
+    for _ in range(MAX_REPAIR_ROUNDS):
+        improved = False
+        for day in range(days):
+            for slot in range(slots):
+                current = choice[day, slot]
+                if current < 0:
+                    continue
+                errors = _errors(day_totals(day, skip=slot) +
+                                 slot_matrices[slot], target) - bonus[slot]
+                errors[~pools.available(slot, keep=current)] = np.inf
+                best = int(np.argmin(errors))
+                if errors[best] < errors[current] - 1e-9:
+                    pools.release(slot, current)
+                    pools.take(slot, best)
+                    choice[day, slot] = best
+                    improved = True
+        if not improved:
+            break
+
+    day_errors = np.array([_errors(day_totals(day), target)
+                           for day in range(days)])
+    return choice, day_errors
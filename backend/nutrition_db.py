@@ -0,0 +1,199 @@
+import csv
+import re
+import threading
+from array import array
+
+import numpy as np
+
+from sqlite_local import ThreadLocalSQLite
+
+# Local ingredient nutrition table. Values are per 100 g and kept in compact
+# array-backed columns, with a dict from normalized ingredient name to row.
+# The table starts from the bundled dataset and grows with ingredients that
+# were resolved through Spoonacular; those are also saved to a small SQLite
+# file so other workers and later restarts can reuse them.
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+
+# Grams per unit for converting ingredient quantities. Volumes assume a
+# water-like density, which is close enough for a rough estimate.
+UNIT_GRAMS = {
+    'g': 1, 'gram': 1, 'grams': 1,
+    'kg': 1000, 'kilogram': 1000, 'kilograms': 1000,
+    'oz': 28.35, 'ounce': 28.35, 'ounces': 28.35,
+    'lb': 453.6, 'lbs': 453.6, 'pound': 453.6, 'pounds': 453.6,
+    'ml': 1, 'milliliter': 1, 'milliliters': 1,
+    'l': 1000, 'liter': 1000, 'liters': 1000,
+    'cup': 240, 'cups': 240,
+    'tbsp': 15, 'tablespoon': 15, 'tablespoons': 15,
+    'tsp': 5, 'teaspoon': 5, 'teaspoons': 5,
+    'slice': 30, 'slices': 30
+}
+
+# Typical weight of one whole item, for quantities given without a unit
+PIECE_GRAMS = {
+    'egg': 50, 'banana': 118, 'apple': 182, 'orange': 131, 'potato': 173,
+    'sweet potato': 130, 'tomato': 123, 'onion': 110, 'carrot': 61,
+    'avocado': 150, 'garlic': 3, 'chicken breast': 174,
+    'flour tortilla': 45, 'white bread': 30, 'whole wheat bread': 30
+}
+DEFAULT_PIECE_GRAMS = 100
+
+
+def normalize_ingredient(name):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return ' '.join(re.sub(r'[^a-z ]', ' ', str(name).lower()).split())
+
+
+def _name_variants(name):
+    """The normalized name plus a naive singular form ('tomatoes' -> 'tomato')"""
+    yield name
+    if name.endswith('es'):
+        yield name[:-2]
+    if name.endswith('s'):
+        yield name[:-1]
+
+
+class IngredientNutritionDB:
+    def __init__(self, dataset_path, learned_db_path=None):
+        self.names = []
+        self.columns = {field: array('f') for field in NUTRIENT_FIELDS}
+        self.index = {}
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._db = ThreadLocalSQLite(learned_db_path, synchronous=None)
+        self.learned_db_path = learned_db_path
+
+        self._load_dataset(dataset_path)
+        self.bundled_count = len(self.names)
+        if learned_db_path:
+            self._db.connect().execute('''
+                CREATE TABLE IF NOT EXISTS ingredients (
+                    name TEXT PRIMARY KEY,
+                    calories REAL NOT NULL,
+                    protein REAL NOT NULL,
+                    carbs REAL NOT NULL,
+                    fat REAL NOT NULL
+                )
+            ''')
+            for row in self._db.connect().execute(
+                    'SELECT name, calories, protein, carbs, fat FROM ingredients'):
+                self._add_row(row[0], row[1:])
+
+    def _load_dataset(self, path):
+        try:
+            with open(path, newline='') as f:
+                for record in csv.DictReader(f):
+                    values = [float(record[field]) for field in NUTRIENT_FIELDS]
+                    row = self._add_row(record['name'], values)
+                    for alias in filter(None, record.get('aliases', '').split('|')):
+                        self.index.setdefault(normalize_ingredient(alias), row)
+        except FileNotFoundError:
+            print(f"Warning: ingredient dataset {path} not found")
+
+    def _add_row(self, name, values):
+        with self._lock:
+            key = normalize_ingredient(name)
+            row = self.index.get(key)
+            if row is None:
+                row = len(self.names)
+                self.names.append(key)
+                for field, value in zip(NUTRIENT_FIELDS, values):
+                    self.columns[field].append(value)
+                self.index[key] = row
+            return row
+
+    def find_row(self, name):
+        """Row number for an ingredient name, or None if it isn't known"""
+        key = normalize_ingredient(name)
+        for variant in _name_variants(key):
+            row = self.index.get(variant)
+            if row is not None:
+                return row
+        return None
+
+    def lookup(self, name):
+        """Per-100 g (calories, protein, carbs, fat) for an ingredient, or None"""
+        row = self.find_row(name)
+        if row is None:
+            row = self._load_learned(name)
+            if row is None:
+                return None
+        return tuple(self.columns[field][row] for field in NUTRIENT_FIELDS)
+
+    def _load_learned(self, name):
+        """Pick up an ingredient another worker resolved since we started"""
+        if not self.learned_db_path:
+            return None
+        found = self._db.connect().execute(
+            'SELECT calories, protein, carbs, fat FROM ingredients WHERE name = ?',
+            (normalize_ingredient(name),)).fetchone()
+        return self._add_row(name, found) if found else None
+
+    def add(self, name, values):
+        """Remember per-100 g values resolved from Spoonacular"""
+        self._add_row(name, values)
+        if self.learned_db_path:
+            self._db.connect().execute(
+                'INSERT OR REPLACE INTO ingredients (name, calories, protein, carbs, fat) VALUES (?, ?, ?, ?, ?)',
+                (normalize_ingredient(name),) + tuple(values))
+
+    def to_grams(self, name, quantity=None, unit=None):
+        """Convert an ingredient quantity to grams (100 g if no quantity is given)"""
+        if quantity is None:
+            return 100.0
+        quantity = float(quantity)
+        unit = normalize_ingredient(unit or '')
+        if unit in UNIT_GRAMS:
+            return quantity * UNIT_GRAMS[unit]
+        # No unit, or one we don't know (e.g. 'large', 'piece'): count items
+        row = self.find_row(name)
+        key = self.names[row] if row is not None else normalize_ingredient(name)
+        return quantity * PIECE_GRAMS.get(key, DEFAULT_PIECE_GRAMS)
+
+    def matrix(self):
+        """Ingredient x nutrient matrix (per 100 g) as a float32 NumPy array"""
+        with self._lock:
+            # Rebuilt only when the table has grown since the last call
+            if self._matrix is None or self._matrix.shape[0] != len(self.names):
+                self._matrix = np.column_stack(
+                    [np.frombuffer(self.columns[field], dtype=np.float32).copy()
+                     for field in NUTRIENT_FIELDS])
+            return self._matrix
+
+    def estimate_meals(self, meals):
+        """Total nutrients for many meals at once.
+
+        `meals` is a list of ingredient lists; each ingredient is a dict with
+        'name' and optional 'quantity' and 'unit'. Returns an array of shape
+        (len(meals), 4) with calories, protein, carbs and fat per meal, and a
+        list with the unknown ingredient names of each meal.
+        """
+        rows, grams, meal_index = [], [], []
+        unresolved = [[] for _ in meals]
+        for i, ingredients in enumerate(meals):
+            for ingredient in ingredients:
+                row = self.find_row(ingredient['name'])
+                if row is None:
+                    unresolved[i].append(ingredient['name'])
+                    continue
+                rows.append(row)
+                grams.append(self.to_grams(ingredient['name'],
+                                           ingredient.get('quantity'),
+                                           ingredient.get('unit')))
+                meal_index.append(i)
+
+        totals = np.zeros((len(meals), len(NUTRIENT_FIELDS)))
+        if rows:
+            matrix = self.matrix()
+            contributions = matrix[np.array(rows)] * \
+                (np.array(grams) / 100.0)[:, None]
+            np.add.at(totals, np.array(meal_index), contributions)
+        return totals, unresolved
+
+    def stats(self):
+        return {
+            'ingredients': len(self.names),
+            'bundled': self.bundled_count,
+            'learned': len(self.names) - self.bundled_count
+        }
@@ -0,0 +1,51 @@
+# Single-pass parsing of Spoonacular `nutrition` objects. Instead of one
+# linear next(...) scan per macro over the nutrients list, the list is walked
+# once and the four macros are picked out by name.
+
+# Spoonacular nutrient name -> NutritionFacts field
+NUTRIENT_FIELDS = {
+    'Calories': 'calories',
+    'Protein': 'protein',
+    'Carbohydrates': 'carbs',
+    'Fat': 'fat'
+}
+
+
+class NutritionFacts:
+    """Calories and macros of a recipe or ingredient; None when not reported"""
+
+    __slots__ = ('calories', 'protein', 'carbs', 'fat')
+
+    def __init__(self, calories=None, protein=None, carbs=None, fat=None):
+        self.calories = calories
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
+
+    def as_tuple(self):
+        """(calories, protein, carbs, fat) with missing values as 0"""
+        return (self.calories or 0, self.protein or 0,
+                self.carbs or 0, self.fat or 0)
+
+    def as_dict(self):
+        """Macros keyed like the API responses, with missing values as 0"""
+        return dict(zip(('calories', 'protein', 'carbs', 'fat'), self.as_tuple()))
+
+    def __repr__(self):
+        return (f"NutritionFacts(calories={self.calories}, protein={self.protein}, "
+                f"carbs={self.carbs}, fat={self.fat})")
+
+
+def parse_nutrition(nutrition):
+    """Parse a Spoonacular `nutrition` object (or None) into NutritionFacts"""
+    facts = NutritionFacts()
+    remaining = len(NUTRIENT_FIELDS)
+    for nutrient in (nutrition or {}).get('nutrients', ()):
+        field = NUTRIENT_FIELDS.get(nutrient.get('name'))
+        # Keep the first match, like the next(...) lookups this replaces
+        if field and getattr(facts, field) is None:
+            setattr(facts, field, nutrient.get('amount', 0))
+            remaining -= 1
+            if not remaining:
+                break
+    return facts
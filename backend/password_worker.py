@@ -0,0 +1,30 @@
+import json
+import sys
+
+from passwords import check_password, hash_password
+
+# Hashing process started by PasswordHasher. Reads one JSON request per line
+# on stdin ({"op": "hash" or "check", "password", "stored", "cost": [n, r,
+# p]}) and writes one JSON reply per line on stdout. Runs as a script so it
+# imports nothing but passwords.py; it exits when stdin closes.
+
+
+def handle(request):
+    n, r, p = request['cost']
+    if request['op'] == 'hash':
+        return hash_password(request['password'], n, r, p)
+    return check_password(request['password'], request['stored'], n, r, p)
+
+
+def main():
+    for line in sys.stdin:
+        try:
+            reply = {'result': handle(json.loads(line))}
+        except Exception as e:
+            reply = {'error': str(e)}
+        sys.stdout.write(json.dumps(reply) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+# Password hashing with salted scrypt. A hash costs tens of milliseconds of
+# CPU by design, so PasswordHasher runs it in a pool of password_worker.py
+# processes: request threads only wait on the result, and a burst of logins
+# can't hold the GIL of a worker serving everything else. The workers import
+# only this module, not the app. Hashes are stored as
+# "scrypt$n$r$p$salt$hash" (base64 salt and hash). Unsalted SHA-256 hex
+# digests from before are still accepted, and replaced with a scrypt hash
+# on the next successful login.
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'password_worker.py')
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 2 ** 20, dklen=KEY_BYTES)
+
+
+def hash_password(password, n=2 ** 14, r=8, p=1):
+    """Salted scrypt hash of a password in the stored format"""
+    salt = os.urandom(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def is_legacy_hash(stored):
+    """Whether a stored hash is an unsalted SHA-256 hex digest"""
+    return not stored.startswith('scrypt$')
+
+
+def verify_password(password, stored):
+    """Whether a password matches a stored hash, scrypt or legacy SHA-256"""
+    if is_legacy_hash(stored):
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, stored)
+    try:
+        _, n, r, p, salt, key = stored.split('$')
+        salt, key = base64.b64decode(salt), base64.b64decode(key)
+        n, r, p = int(n), int(r), int(p)
+    except ValueError:
+        return False
+    return hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+
+
+def needs_rehash(stored, n, r, p):
+    """Whether a stored hash is legacy or uses other cost settings"""
+    return is_legacy_hash(stored) or stored.split('$')[1:4] != [str(n), str(r), str(p)]
+
+
+def check_password(password, stored, n=2 ** 14, r=8, p=1):
+    """Verify a password; returns (matches, new hash or None). A new hash is
+    made when the stored one is legacy or has other cost settings."""
+    if not verify_password(password, stored):
+        return False, None
+    if needs_rehash(stored, n, r, p):
+        return True, hash_password(password, n, r, p)
+    return True, None
+
+
+class _Worker:
+    """One password_worker.py process, answering a JSON request per line"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, text=True)
+        # Replies are read on a thread so a stuck worker can be timed out
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._replies.put(line)
+        self._replies.put('')
+
+    def call(self, request, timeout):
+        """Send a request and return the worker's reply"""
+        self.process.stdin.write(json.dumps(request) + '\n')
+        self.process.stdin.flush()
+        try:
+            line = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Password worker gave no reply in {timeout}s")
+        if not line:
+            raise RuntimeError('Password worker exited')
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class PasswordHasher:
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=None, timeout=30):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = workers or os.cpu_count() or 1
+        # Longest wait for a free worker, and for a worker's reply
+        self.timeout = timeout
+        # Workers start on first use, so each gunicorn worker gets its own
+        self._idle = queue.LifoQueue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self.hashes = 0
+        self.checks = 0
+        self.upgrades = 0
+        self.total_seconds = 0.0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = self._started < self.workers
+            if start:
+                self._started += 1
+        if start:
+            try:
+                return _Worker()
+            except OSError:
+                with self._lock:
+                    self._started -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No password worker free after {self.timeout}s")
+
+    def _run(self, request):
+        start = time.monotonic()
+        worker = self._acquire()
+        try:
+            reply = worker.call(dict(request, cost=[self.n, self.r, self.p]),
+                                self.timeout)
+        except (OSError, ValueError, RuntimeError, TimeoutError):
+            # Replace a worker that died, hung or answered garbage
+            worker.kill()
+            with self._lock:
+                self._started -= 1
+            raise
+        # An error reply comes from a healthy worker, e.g. one given a
+        # stored hash with invalid cost settings
+        self._idle.put(worker)
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        with self._lock:
+            self.total_seconds += time.monotonic() - start
+        return reply['result']
+
+    def hash(self, password):
+        """Hash a new password with the current cost settings"""
+        stored = self._run({'op': 'hash', 'password': password})
+        with self._lock:
+            self.hashes += 1
+        return stored
+
+    def check(self, password, stored):
+        """Verify a password; returns (matches, upgraded hash or None)"""
+        matches, upgraded = self._run({'op': 'check', 'password': password,
+                                       'stored': stored})
+        with self._lock:
+            self.checks += 1
+            if upgraded:
+                self.upgrades += 1
+        return matches, upgraded
+
+    def shutdown(self):
+        """Stop the idle workers"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.close()
+            with self._lock:
+                self._started -= 1
+
+    def stats(self):
+        with self._lock:
+            calls = self.hashes + self.checks
+            return {
+                'algorithm': 'scrypt',
+                'n': self.n,
+                'r': self.r,
+                'p': self.p,
+                'workers': self.workers,
+                'hashes': self.hashes,
+                'checks': self.checks,
+                'upgrades': self.upgrades,
+                'avg_ms': round(self.total_seconds / calls * 1000, 1) if calls else 0.0
+            }
@@ -0,0 +1,144 @@
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Spoonacular quota accounting. Every response carries X-API-Quota-Request
+# (points the call cost) and X-API-Quota-Used (points used today); the
+# tracker records both, per endpoint and per user, and works out how much
+# of the daily budget is left. Spoonacular resets quotas at midnight UTC,
+# and so does the tracker. Once the remaining budget drops to the low mark
+# callers switch to cheaper behaviour; a 402 means the quota is spent for
+# the rest of the day.
+
+# Number of users listed in stats(), heaviest first
+TOP_USERS = 20
+
+
+def endpoint_name(endpoint):
+    """'food/ingredients/9266/information' -> 'food/ingredients/{id}/information'"""
+    return re.sub(r'/\d+(?=/|$)', '/{id}', endpoint.strip('/'))
+
+
+def header_points(response, name):
+    """Float value of a quota header, or None if missing or invalid"""
+    try:
+        return float(response.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class QuotaTracker:
+    def __init__(self, daily_limit=None, low_budget=None):
+        # Without a configured limit, the X-API-Quota-Left header (if sent)
+        # is the only source for the remaining budget
+        self.daily_limit = daily_limit
+        # Defaults to a tenth of the daily limit
+        self.low_budget = low_budget
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset(None)
+
+    def _reset(self, day):
+        self.day = day
+        self.used = 0.0
+        self.left = None
+        self.exhausted = False
+        self.endpoints = {}
+        self.users = {}
+
+    def _today(self):
+        """Current UTC date, clearing the counters when it changes"""
+        today = datetime.now(timezone.utc).date()
+        if self.day != today:
+            self._reset(today)
+        return today
+
+    def current_user(self):
+        return getattr(self._local, 'user', None)
+
+    def set_user(self, user):
+        """Charge calls made by this thread to a user (None for no one)"""
+        self._local.user = user
+
+    @contextmanager
+    def attribute(self, user):
+        previous = self.current_user()
+        self.set_user(user)
+        try:
+            yield
+        finally:
+            self.set_user(previous)
+
+    def record(self, endpoint, response):
+        """Account for one Spoonacular response"""
+        points = header_points(response, 'X-API-Quota-Request')
+        used = header_points(response, 'X-API-Quota-Used')
+        left = header_points(response, 'X-API-Quota-Left')
+        if points is None:
+            points = 1.0 if response.ok else 0.0
+        user = self.current_user() or 'anonymous'
+        with self._lock:
+            self._today()
+            # The headers are authoritative; counting only covers responses
+            # without them
+            self.used = used if used is not None else self.used + points
+            if left is not None:
+                self.left = left
+            if response.status_code == 402:
+                self.exhausted = True
+            for counts, key in ((self.endpoints, endpoint_name(endpoint)),
+                                (self.users, user)):
+                entry = counts.setdefault(key, {'calls': 0, 'points': 0.0})
+                entry['calls'] += 1
+                entry['points'] += points
+
+    def _remaining(self):
+        if self.exhausted:
+            return 0.0
+        if self.left is not None:
+            return max(0.0, self.left)
+        if self.daily_limit is not None:
+            return max(0.0, self.daily_limit - self.used)
+        return None
+
+    def remaining(self):
+        """Points left today, or None if the budget is unknown"""
+        with self._lock:
+            self._today()
+            return self._remaining()
+
+    def _low_mark(self):
+        if self.low_budget is not None:
+            return self.low_budget
+        limit = self.daily_limit
+        if limit is None and self.left is not None:
+            limit = self.used + self.left
+        return limit / 10 if limit else 0.0
+
+    def low(self):
+        """Whether the budget has run low enough to degrade to cheaper calls"""
+        with self._lock:
+            self._today()
+            remaining = self._remaining()
+            return remaining is not None and remaining <= self._low_mark()
+
+    def stats(self):
+        with self._lock:
+            self._today()
+            remaining = self._remaining()
+            users = sorted(self.users.items(), key=lambda item: -item[1]['points'])
+            return {
+                'day': self.day.isoformat(),
+                'daily_limit': self.daily_limit,
+                'used': round(self.used, 2),
+                'remaining': round(remaining, 2) if remaining is not None else None,
+                'low_budget': round(self._low_mark(), 2),
+                'degraded': remaining is not None and remaining <= self._low_mark(),
+                'exhausted': self.exhausted,
+                'endpoints': {name: dict(entry, points=round(entry['points'], 2))
+                              for name, entry in self.endpoints.items()},
+                'users': {name: dict(entry, points=round(entry['points'], 2))
+                          for name, entry in users[:TOP_USERS]},
+                'user_count': len(self.users)
+            }
@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-upstream call scheduling. Every call to an upstream API first waits
+# for a slot: a token from a token bucket (requests per second, with a
+# burst), a free spot under the concurrency limit, and its turn in a
+# priority queue, so interactive requests go ahead of background refreshes.
+# With a budget (see quota.py), calls stop once its remaining points are
+# spent.
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+_local = threading.local()
+
+
+def current_priority():
+    return getattr(_local, 'priority', NORMAL)
+
+
+@contextmanager
+def priority(level):
+    """Run upstream calls made by this thread at the given priority"""
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class UpstreamBusyError(Exception):
+    """No upstream slot became free within the allowed wait"""
+
+
+class DailyBudgetExceeded(UpstreamBusyError):
+    """The upstream's budget for today is spent"""
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Take one token; returns 0 if taken, else seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class UpstreamScheduler:
+    def __init__(self, name, rate, burst=None, max_concurrency=10,
+                 budget=None, max_wait=30):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst or max(1, rate))
+        self.max_concurrency = max_concurrency
+        # Anything with a remaining() method returning points left or None
+        self.budget = budget
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.active = 0
+        self.calls = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.max_queue_depth = 0
+
+    def acquire(self, level=None):
+        """Wait for a slot; raises UpstreamBusyError after max_wait seconds"""
+        if self.budget is not None and self.budget.remaining() == 0:
+            with self._cond:
+                self.rejected += 1
+            raise DailyBudgetExceeded(f"{self.name} budget for today is spent")
+
+        level = current_priority() if level is None else level
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._cond:
+            entry = (level, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = deadline - now
+                    if self._waiting[0] == entry and self.active < self.max_concurrency:
+                        token_wait = self.bucket.take(now)
+                        if not token_wait:
+                            heapq.heappop(self._waiting)
+                            break
+                        delay = min(delay, token_wait)
+                    if deadline <= now:
+                        self.rejected += 1
+                        raise UpstreamBusyError(
+                            f"{self.name} is busy: waited {self.max_wait}s for a slot")
+                    self._cond.wait(delay)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+            waited = time.monotonic() - start
+            self.active += 1
+            self.calls += 1
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+            # The next waiter may be able to go too
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, level=None):
+        self.acquire(level)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def run(self, fn, level=None):
+        """Call fn() once a slot is free"""
+        with self.slot(level):
+            return fn()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'rate_per_second': self.bucket.rate,
+                'burst': self.bucket.capacity,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.active,
+                'queue_depth': len(self._waiting),
+                'max_queue_depth': self.max_queue_depth,
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'avg_wait_ms': round(self.total_wait / self.calls * 1000, 1) if self.calls else 0.0,
+                'max_wait_ms': round(self.max_wait_seen * 1000, 1)
+            }
@@ -0,0 +1,267 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from nutrition_parser import parse_nutrition
+from restrictions import TAGGED_DIETS, ingredient_mask, singular
+
+# In-memory pool of recipes seen in past complexSearch and /information
+# responses, indexed so filtered searches can be answered locally. Diets,
+# cuisines, ingredients, search terms and readyInMinutes buckets map to sets
+# of row numbers; calories and protein are kept in NumPy columns with a
+# lazily re-sorted row order for range queries, and each row's ingredient
+# group bitmask (see restrictions.py) in an integer column.
+
+# Upper bounds (minutes) of the readyInMinutes buckets; the last is open
+READY_TIME_BUCKETS = (15, 30, 45, 60, 90, 120)
+
+# Boolean recipe flags that Spoonacular doesn't always repeat in `diets`
+DIET_FLAGS = {
+    'vegetarian': 'vegetarian',
+    'vegan': 'vegan',
+    'glutenFree': 'gluten free',
+    'dairyFree': 'dairy free',
+    'ketogenic': 'ketogenic'
+}
+
+# Names in recipe `diets` lists that answer a differently named diet filter
+DIET_ALIASES = {
+    'lacto ovo vegetarian': 'vegetarian',
+    'pescatarian': 'pescetarian',
+    'paleolithic': 'paleo',
+    'whole 30': 'whole30'
+}
+
+RANGE_FIELDS = ('calories', 'protein')
+
+
+def _words(value):
+    return str(value or '').lower().replace(',', ' ').split()
+
+
+def recipe_diets(recipe):
+    """Normalized diets a recipe satisfies"""
+    diets = {str(diet).lower() for diet in recipe.get('diets') or []}
+    diets |= {DIET_ALIASES[diet] for diet in diets if diet in DIET_ALIASES}
+    diets |= {diet for flag, diet in DIET_FLAGS.items() if recipe.get(flag)}
+    return diets
+
+
+def recipe_ingredients(recipe):
+    """Normalized ingredient names from extendedIngredients or nutrition"""
+    items = list(recipe.get('extendedIngredients') or [])
+    items += (recipe.get('nutrition') or {}).get('ingredients') or []
+    names = set()
+    for item in items:
+        name = item.get('nameClean') or item.get('name')
+        if name:
+            names.add(' '.join(_words(name)))
+    return names
+
+
+class RecipePool:
+    def __init__(self, max_recipes=5000, ttl=24 * 3600):
+        self.max_recipes = max_recipes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._recipes = []
+        self._added_at = []
+        self._rows = OrderedDict()
+        self._free_rows = []
+        self._indexes = {name: defaultdict(set) for name in
+                         ('diet', 'cuisine', 'ingredient', 'term', 'ready')}
+        self._row_keys = []
+        self._ready = np.zeros(0)
+        self._masks = np.zeros(0, dtype=np.int64)
+        self._columns = {field: np.zeros(0) for field in RANGE_FIELDS}
+        self._sorted = {}
+        self.local_hits = 0
+        self.upstream_fetches = 0
+
+    def _keys(self, recipe):
+        """(index, key) pairs a recipe is filed under"""
+        keys = [('diet', diet) for diet in recipe_diets(recipe)]
+        keys += [('cuisine', str(cuisine).lower())
+                 for cuisine in recipe.get('cuisines') or []]
+        ingredients = recipe_ingredients(recipe)
+        keys += [('ingredient', name) for name in ingredients]
+        terms = set(_words(recipe.get('title')))
+        for dish_type in recipe.get('dishTypes') or []:
+            terms.update(_words(dish_type))
+        for name in ingredients:
+            terms.update(name.split())
+        terms |= {singular(term) for term in terms}
+        keys += [('term', term) for term in terms]
+        ready = recipe.get('readyInMinutes')
+        if ready is not None:
+            keys.append(('ready', bisect_left(READY_TIME_BUCKETS, ready)))
+        return keys
+
+    def _grow(self, size):
+        """Make room in the NumPy columns for `size` rows"""
+        if size <= len(self._ready):
+            return
+        new_size = max(size, 2 * len(self._ready), 64)
+
+        def grown(column):
+            bigger = np.full(new_size, np.nan)
+            bigger[:len(column)] = column
+            return bigger
+        self._ready = grown(self._ready)
+        masks = np.zeros(new_size, dtype=np.int64)
+        masks[:len(self._masks)] = self._masks
+        self._masks = masks
+        for field in RANGE_FIELDS:
+            self._columns[field] = grown(self._columns[field])
+
+    def _unindex(self, row):
+        for name, key in self._row_keys[row]:
+            self._indexes[name][key].discard(row)
+        self._row_keys[row] = []
+
+    def add_many(self, recipes, refresh_only=False):
+        """Add or refresh recipes from complexSearch or /information responses.
+
+        With refresh_only, recipes not already in the pool are skipped; used
+        for /information payloads, which lack the nutrition searches need.
+        """
+        now = time.time()
+        with self._lock:
+            for recipe in recipes:
+                if not recipe or 'id' not in recipe:
+                    continue
+                row = self._rows.get(recipe['id'])
+                if row is not None:
+                    # /information payloads carry no nutrition; keep what the
+                    # search result had
+                    old = self._recipes[row]
+                    if 'nutrition' not in recipe and 'nutrition' in old:
+                        recipe = dict(recipe, nutrition=old['nutrition'])
+                    self._unindex(row)
+                    self._rows.move_to_end(recipe['id'])
+                elif refresh_only:
+                    continue
+                else:
+                    if len(self._rows) >= self.max_recipes:
+                        _, oldest = self._rows.popitem(last=False)
+                        self._unindex(oldest)
+                        self._recipes[oldest] = None
+                        self._ready[oldest] = np.nan
+                        for field in RANGE_FIELDS:
+                            self._columns[field][oldest] = np.nan
+                        self._free_rows.append(oldest)
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        row = len(self._recipes)
+                        self._recipes.append(None)
+                        self._added_at.append(0)
+                        self._row_keys.append([])
+                        self._grow(row + 1)
+                    self._rows[recipe['id']] = row
+
+                self._recipes[row] = recipe
+                self._added_at[row] = now
+                keys = self._keys(recipe)
+                for name, key in keys:
+                    self._indexes[name][key].add(row)
+                self._row_keys[row] = keys
+                self._masks[row] = ingredient_mask(recipe_ingredients(recipe))
+                facts = parse_nutrition(recipe.get('nutrition'))
+                for column, value in ((self._ready, recipe.get('readyInMinutes')),
+                                      (self._columns['calories'], facts.calories),
+                                      (self._columns['protein'], facts.protein)):
+                    column[row] = np.nan if value is None else value
+            self._sorted.clear()
+
+    def _sorted_column(self, field):
+        """(row order, sorted values) of a range column with NaNs last,
+        rebuilt after the pool changes"""
+        if field not in self._sorted:
+            column = self._columns[field][:len(self._recipes)]
+            order = np.argsort(column, kind='stable')
+            self._sorted[field] = (order, column[order])
+        return self._sorted[field]
+
+    def _range_rows(self, field, low, high):
+        order, values = self._sorted_column(field)
+        start = np.searchsorted(values, low, side='left') if low is not None else 0
+        end = np.searchsorted(values, high, side='right') if high is not None \
+            else np.searchsorted(values, np.inf, side='right')
+        return order[start:end]
+
+    def query(self, terms=(), diets=(), cuisines=(), max_ready_time=None,
+              calories=(None, None), protein=(None, None), restrictions=None):
+        """Recipes matching every filter, in pool order.
+
+        `diets` must all match; each entry may be 'a|b' for either. `cuisines`
+        match if any does. `terms` must all appear in the title, dish types or
+        ingredients. `calories` and `protein` are (min, max) ranges.
+        `restrictions` is a RestrictionProfile; its diets must be tagged on
+        the recipe and its excluded ingredients must not appear.
+        """
+        now = time.time()
+        if restrictions:
+            diets = list(diets) + sorted(restrictions.diets & TAGGED_DIETS)
+        with self._lock:
+            candidates = []
+            for term in terms:
+                candidates.append(self._indexes['term'].get(term, set()))
+            for diet in diets:
+                options = [self._indexes['diet'].get(option.strip(), set())
+                           for option in diet.split('|')]
+                candidates.append(set().union(*options))
+            if cuisines:
+                candidates.append(set().union(
+                    *[self._indexes['cuisine'].get(cuisine, set()) for cuisine in cuisines]))
+            if max_ready_time is not None:
+                last_bucket = bisect_left(READY_TIME_BUCKETS, max_ready_time)
+                candidates.append(set().union(
+                    *[self._indexes['ready'].get(bucket, set())
+                      for bucket in range(last_bucket + 1)]))
+            for field, (low, high) in (('calories', calories), ('protein', protein)):
+                if low is not None or high is not None:
+                    candidates.append(set(self._range_rows(field, low, high).tolist()))
+
+            if candidates:
+                candidates.sort(key=len)
+                rows = set(candidates[0]).intersection(*candidates[1:])
+            else:
+                rows = set(self._rows.values())
+            rows = np.array(sorted(rows), dtype=int)
+            if max_ready_time is not None and len(rows):
+                # The last bucket may hold recipes just over the limit
+                rows = rows[self._ready[rows] <= max_ready_time]
+            if restrictions and len(rows):
+                rows = rows[(self._masks[rows] & restrictions.excluded_mask) == 0]
+                excluded = set().union(*[self._indexes[name].get(word, set())
+                                         for name in ('term', 'ingredient')
+                                         for word in restrictions.excluded_words])
+                if excluded:
+                    rows = rows[~np.isin(rows, list(excluded))]
+
+            # Evicted rows can still turn up in a range query
+            return [self._recipes[row] for row in rows.tolist()
+                    if self._recipes[row] is not None and
+                    now - self._added_at[row] < self.ttl]
+
+    def record(self, local):
+        """Count whether a query was answered from the pool or upstream"""
+        with self._lock:
+            if local:
+                self.local_hits += 1
+            else:
+                self.upstream_fetches += 1
+
+    def stats(self):
+        total = self.local_hits + self.upstream_fetches
+        return {
+            'recipes': len(self._rows),
+            'max_recipes': self.max_recipes,
+            'local_hits': self.local_hits,
+            'upstream_fetches': self.upstream_fetches,
+            'local_ratio': round(self.local_hits / total, 3) if total else 0.0
+        }
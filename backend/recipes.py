@@ -0,0 +1,148 @@
+import json
+import time
+import zlib
+
+from sqlite_local import ThreadLocalSQLite
+
+# Recipe detail lookups. Full recipe information is fetched with Spoonacular's
+# recipes/informationBulk endpoint so a whole plan's worth of recipes costs
+# one request instead of one /recipes/{id}/information call per meal, and is
+# kept in an on-disk cache shared by every worker process.
+
+
+def recipe_id_int(recipe_id):
+    """A Spoonacular recipe ID as an int, or None if it isn't one"""
+    try:
+        return int(recipe_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class RecipeCache:
+    """SQLite cache of full recipe information keyed by Spoonacular recipe ID.
+
+    Entries expire after `ttl` seconds; once more than `max_entries` are
+    stored the least recently used ones are evicted. Payloads are stored as
+    zlib-compressed JSON.
+    """
+
+    # Only rewrite an entry's last-used time when it is older than this, so
+    # cache hits don't turn into a write every time
+    TOUCH_INTERVAL = 600
+
+    def __init__(self, db_path, ttl=24 * 3600, max_entries=10000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db = ThreadLocalSQLite(db_path)
+        self.hits = 0
+        self.misses = 0
+        self._db.connect().execute('''
+            CREATE TABLE IF NOT EXISTS recipes (
+                id INTEGER PRIMARY KEY,
+                payload BLOB NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._db.connect().execute(
+            'CREATE INDEX IF NOT EXISTS recipes_last_used ON recipes (last_used)')
+
+    def get_many(self, recipe_ids):
+        """Return {id: recipe} for the IDs that are cached and still fresh"""
+        ids = list(recipe_ids)
+        if not ids:
+            return {}
+        now = time.time()
+        conn = self._db.connect()
+        rows = []
+        # Stay under SQLite's limit on bound parameters per statement
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows += conn.execute(
+                f'SELECT id, payload, last_used FROM recipes WHERE id IN ({placeholders}) AND fetched_at > ?',
+                chunk + [now - self.ttl]).fetchall()
+
+        found = {}
+        stale_touch = []
+        for recipe_id, payload, last_used in rows:
+            found[recipe_id] = json.loads(zlib.decompress(payload))
+            if now - last_used > self.TOUCH_INTERVAL:
+                stale_touch.append((now, recipe_id))
+        if stale_touch:
+            conn.executemany(
+                'UPDATE recipes SET last_used = ? WHERE id = ?', stale_touch)
+
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        return found
+
+    def put_many(self, recipes):
+        """Store full recipe payloads, evicting old entries past max_entries"""
+        if not recipes:
+            return
+        now = time.time()
+        conn = self._db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO recipes (id, payload, fetched_at, last_used) VALUES (?, ?, ?, ?)',
+                [(recipe['id'], zlib.compress(json.dumps(recipe).encode()), now, now)
+                 for recipe in recipes])
+            excess = conn.execute(
+                'SELECT COUNT(*) FROM recipes').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    'DELETE FROM recipes WHERE id IN (SELECT id FROM recipes ORDER BY last_used LIMIT ?)',
+                    (excess,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': self._db.connect().execute('SELECT COUNT(*) FROM recipes').fetchone()[0],
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class RecipeDetailService:
+    def __init__(self, client, chunk_size=50, cache=None):
+        self.client = client
+        self.chunk_size = chunk_size
+        self.cache = cache
+
+    def get_many(self, recipe_ids):
+        """Fetch full information for recipe IDs; returns {id: recipe}.
+        IDs Spoonacular doesn't return, or that aren't integers, are left
+        out."""
+        ids = list(dict.fromkeys(filter(None, map(recipe_id_int, recipe_ids))))
+        details = self.cache.get_many(ids) if self.cache else {}
+        ids = [recipe_id for recipe_id in ids if recipe_id not in details]
+
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start + self.chunk_size]
+            response = self.client.get('recipes/informationBulk', params={
+                'ids': ','.join(str(recipe_id) for recipe_id in chunk)
+            })
+            if not response.ok:
+                print(
+                    f"informationBulk failed for {len(chunk)} recipes: {response.status_code}")
+                continue
+            fetched = response.json()
+            for recipe in fetched:
+                details[recipe['id']] = recipe
+            if self.cache:
+                self.cache.put_many(fetched)
+        return details
+
+    def get(self, recipe_id):
+        """Fetch full information for a single recipe, or None"""
+        return self.get_many([recipe_id]).get(recipe_id_int(recipe_id))
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import BACKGROUND, priority
+
+# In-process cache for upstream query results (recipe searches, ingredient
+# searches). Entries are fresh for `ttl` seconds; for a further `stale_ttl`
+# seconds the old result is still served while one background refresh
+# fetches a new one. Refreshes run at background priority, behind
+# requests a user is waiting on. While `serve_stale()` is true (the upstream
+# budget is low), cached values of any age are served and nothing is
+# refreshed.
+
+
+def normalize_text(value):
+    """Lowercase and collapse whitespace so equivalent queries share a key"""
+    return ' '.join(str(value).lower().split())
+
+
+def normalize_ingredients(ingredients):
+    """'Milk, Egg' and 'egg,milk' both become 'egg,milk'"""
+    items = {normalize_text(item) for item in str(ingredients).split(',')}
+    return ','.join(sorted(item for item in items if item))
+
+
+def make_key(endpoint, params):
+    """Build a cache key from an endpoint and its (already normalized) params"""
+    return (endpoint,) + tuple(sorted((k, str(v)) for k, v in params.items()
+                                      if v not in (None, '')))
+
+
+class ResponseCache:
+    def __init__(self, ttl=300, stale_ttl=3600, max_entries=2000, serve_stale=None):
+        self.ttl = ttl
+        self.serve_stale = serve_stale
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2)
+        self.hits = 0
+        self.stale_hits = 0
+        self.degraded_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch() on a miss.
+
+        Errors from fetch() propagate and nothing is cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if self.serve_stale is not None and self.serve_stale():
+                    self._entries.move_to_end(key)
+                    self.degraded_hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._refresher.submit(self._refresh, key, fetch)
+                    return value
+            self.misses += 1
+
+        value = fetch()
+        self._store(key, value)
+        return value
+
+    def _refresh(self, key, fetch):
+        try:
+            with priority(BACKGROUND):
+                self._store(key, fetch())
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit retries
+            print(f"Background refresh failed for {key}: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        served = self.hits + self.stale_hits + self.degraded_hits
+        total = served + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'stale_ttl_seconds': self.stale_ttl,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'degraded_hits': self.degraded_hits,
+            'misses': self.misses,
+            'refresh_errors': self.refresh_errors,
+            'hit_ratio': round(served / total, 3) if total else 0.0
+        }
@@ -0,0 +1,295 @@
+import re
+from functools import lru_cache
+
+# Dietary restriction engine. Free-text restrictions ("vegetarian, no
+# peanuts, allergic to shellfish, hate mushrooms") are compiled once into a
+# RestrictionProfile: the diets a recipe must be tagged with, a bitmask of
+# excluded ingredient groups, and a set of other excluded ingredient words.
+# Each recipe's ingredient names are reduced to the same bitmask, so checking
+# a recipe against a profile is a single AND plus a set intersection.
+
+# Ingredient groups that restrictions exclude, by the words that identify them
+INGREDIENT_GROUPS = {
+    'meat': {'beef', 'pork', 'chicken', 'turkey', 'lamb', 'veal', 'bacon', 'ham',
+             'sausage', 'pepperoni', 'salami', 'prosciutto', 'chorizo', 'duck',
+             'steak', 'meat', 'gelatin', 'lard', 'venison', 'goat'},
+    'pork': {'pork', 'bacon', 'ham', 'prosciutto', 'pancetta', 'chorizo',
+             'salami', 'pepperoni', 'lard'},
+    'beef': {'beef', 'steak', 'veal', 'brisket'},
+    'fish': {'fish', 'salmon', 'tuna', 'cod', 'tilapia', 'anchovy', 'anchovies',
+             'sardine', 'trout', 'halibut', 'mackerel', 'haddock', 'snapper'},
+    'shellfish': {'shrimp', 'prawn', 'crab', 'lobster', 'scallop', 'clam',
+                  'mussel', 'oyster', 'shellfish', 'crawfish', 'squid', 'calamari'},
+    'dairy': {'milk', 'cheese', 'butter', 'cream', 'yogurt', 'yoghurt', 'ghee',
+              'whey', 'casein', 'parmesan', 'mozzarella', 'cheddar', 'ricotta',
+              'feta', 'buttermilk', 'mascarpone'},
+    'egg': {'egg', 'eggs', 'mayonnaise', 'mayo', 'meringue'},
+    'gluten': {'wheat', 'flour', 'bread', 'pasta', 'barley', 'rye', 'couscous',
+               'breadcrumbs', 'noodles', 'spaghetti', 'tortilla', 'seitan',
+               'semolina', 'bulgur', 'farro', 'cracker', 'crackers'},
+    'peanut': {'peanut', 'peanuts'},
+    'tree nut': {'almond', 'almonds', 'walnut', 'walnuts', 'pecan', 'pecans',
+                 'cashew', 'cashews', 'pistachio', 'pistachios', 'hazelnut',
+                 'hazelnuts', 'macadamia', 'nut', 'nuts'},
+    'soy': {'soy', 'tofu', 'edamame', 'tempeh', 'miso'},
+    'sesame': {'sesame', 'tahini'},
+    'honey': {'honey'}
+}
+
+# Ingredient phrases of up to three words whose words would put them in the
+# wrong group, and the group they are really in (None for none): goat cheese
+# is dairy, not meat, and a cauliflower steak is a vegetable
+NOT_IN_GROUPS = {
+    'peanut butter': 'peanut', 'almond butter': 'tree nut',
+    'cocoa butter': None, 'apple butter': None, 'coconut milk': None,
+    'almond milk': 'tree nut', 'soy milk': 'soy', 'oat milk': None,
+    'rice milk': None, 'coconut cream': None, 'cream of tartar': None,
+    'gluten free flour': None, 'rice flour': None, 'almond flour': 'tree nut',
+    'coconut flour': None, 'rice noodles': None, 'corn tortilla': None,
+    'corn tortillas': None, 'goat cheese': 'dairy', 'goat milk': 'dairy',
+    'cauliflower steak': None, 'mushroom steak': None, 'tofu steak': 'soy',
+    'tuna steak': 'fish', 'salmon steak': 'fish', 'coconut meat': None,
+    'crab meat': 'shellfish', 'lobster meat': 'shellfish', 'beef tomato': None,
+    'duck sauce': None
+}
+
+GROUP_BITS = {group: 1 << bit for bit, group in enumerate(INGREDIENT_GROUPS)}
+
+# Word -> bitmask of the groups it belongs to
+WORD_BITS = {}
+for _group, _words in INGREDIENT_GROUPS.items():
+    for _word in _words:
+        WORD_BITS[_word] = WORD_BITS.get(_word, 0) | GROUP_BITS[_group]
+
+
+def _bits(*groups):
+    mask = 0
+    for group in groups:
+        mask |= GROUP_BITS[group]
+    return mask
+
+
+# Diet restriction -> (Spoonacular diet, ingredient groups it excludes)
+DIETS = {
+    'vegetarian': ('vegetarian', _bits('meat', 'fish', 'shellfish')),
+    'vegan': ('vegan', _bits('meat', 'fish', 'shellfish', 'dairy', 'egg', 'honey')),
+    'pescatarian': ('pescetarian', _bits('meat')),
+    'pescetarian': ('pescetarian', _bits('meat')),
+    'gluten free': ('gluten free', _bits('gluten')),
+    'dairy free': ('dairy free', _bits('dairy')),
+    'lactose free': ('dairy free', _bits('dairy')),
+    'keto': ('ketogenic', 0),
+    'ketogenic': ('ketogenic', 0),
+    'paleo': ('paleo', 0),
+    'primal': ('primal', 0),
+    'whole30': ('whole30', 0)
+}
+
+# Diets Spoonacular reliably tags recipes with; others (keto) can only be
+# applied by its search filter
+TAGGED_DIETS = {'vegetarian', 'vegan', 'pescetarian', 'gluten free',
+                'dairy free', 'paleo', 'primal', 'whole30'}
+
+# Other names users give ingredient groups
+GROUP_ALIASES = {
+    'meats': 'meat', 'red meat': 'beef', 'seafood': 'shellfish',
+    'nuts': 'tree nut', 'nut': 'tree nut', 'tree nuts': 'tree nut',
+    'peanuts': 'peanut', 'lactose': 'dairy', 'milk': 'dairy', 'eggs': 'egg',
+    'wheat': 'gluten', 'soya': 'soy', 'shrimp': 'shellfish'
+}
+
+# Spoonacular complexSearch `intolerances` values for excluded groups
+INTOLERANCES = {
+    'dairy': 'dairy', 'egg': 'egg', 'gluten': 'gluten', 'peanut': 'peanut',
+    'shellfish': 'shellfish', 'fish': 'seafood', 'soy': 'soy',
+    'sesame': 'sesame', 'tree nut': 'tree nut'
+}
+
+# Words around the diet or ingredient in a restriction ("I'm allergic to
+# peanuts", "severe shellfish allergy", "vegan diet")
+FILLER_WORDS = {
+    'no', 'not', 'non', 'without', 'avoid', 'avoids', 'avoiding', 'allergic',
+    'allergy', 'allergies', 'intolerant', 'intolerance', 'intolerances',
+    'sensitive', 'sensitivity', 'dislike', 'dislikes', 'hate', 'hates',
+    'i', "i'm", 'im', 'am', 'me', 'my', 'to', "don't", 'dont', "can't", 'cant',
+    'cannot', 'do', 'eat', 'like', 'any', 'a', 'an', 'the', 'of', 'is', 'are',
+    'have', 'has', 'severe', 'severely', 'mild', 'strict', 'strictly', 'very',
+    'diet', 'please', 'only', 'all', 'foods', 'food', 'products'
+}
+
+# Parts of a restriction list
+_SEPARATORS = re.compile(r"[,;\n&/+]|\b(?:and|or|plus)\b")
+
+NO_RESTRICTIONS = {'none', 'n', 'na', 'nothing'}
+
+
+def _tokens(part):
+    """Lowercase words of a restriction, without punctuation or filler"""
+    part = re.sub(r"[^a-z0-9' ]", ' ', part.replace('-', ' '))
+    return [word.strip("'") for word in part.split()
+            if word not in FILLER_WORDS and word.strip("'")]
+
+
+def _group(item):
+    """Ingredient group an item names, or None"""
+    for name in (item, singular(item)):
+        group = GROUP_ALIASES.get(name, name)
+        if group in GROUP_BITS:
+            return group
+    return None
+
+
+def singular(word):
+    """Naive singular form of an ingredient word ('berries' -> 'berry')"""
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith('es') and word[:-2] in WORD_BITS:
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def _exception_phrase(words, start):
+    """NOT_IN_GROUPS phrase starting at words[start], or None"""
+    for length in (3, 2):
+        if start + length > len(words):
+            continue
+        span = words[start:start + length]
+        for phrase in (' '.join(span), ' '.join(span[:-1] + [singular(span[-1])])):
+            if phrase in NOT_IN_GROUPS:
+                return phrase
+    return None
+
+
+def ingredient_mask(names):
+    """Bitmask of the ingredient groups present in normalized ingredient names"""
+    mask = 0
+    for name in names:
+        words = name.split()
+        i = 0
+        while i < len(words):
+            phrase = _exception_phrase(words, i)
+            if phrase:
+                group = NOT_IN_GROUPS[phrase]
+                mask |= GROUP_BITS[group] if group else 0
+                i += len(phrase.split())
+                continue
+            word = words[i]
+            mask |= WORD_BITS.get(word, 0) | WORD_BITS.get(singular(word), 0)
+            i += 1
+    return mask
+
+
+def ingredient_words(names):
+    """Names plus their single words, in plain and singular form"""
+    words = set()
+    for name in names:
+        words.add(name)
+        words.add(singular(name))
+        for word in name.split():
+            words.add(word)
+            words.add(singular(word))
+    return words
+
+
+class RestrictionProfile:
+    """Compiled restrictions: required diets, excluded groups and words"""
+
+    def __init__(self, diets=frozenset(), excluded_mask=0, excluded_items=frozenset()):
+        self.diets = diets
+        self.excluded_mask = excluded_mask
+        self.excluded_items = excluded_items
+        # Matched against ingredient words in both forms
+        self.excluded_words = frozenset(excluded_items) | \
+            frozenset(singular(item) for item in excluded_items)
+        # Diets that only the upstream search can check
+        self.untagged_diets = diets - TAGGED_DIETS
+
+    def __bool__(self):
+        return bool(self.diets or self.excluded_mask or self.excluded_items)
+
+    def allows(self, diets, names, mask=None):
+        """Whether a recipe with these diet tags and ingredient names fits.
+
+        `mask` is ingredient_mask(names), if already computed. `diets` is
+        None for recipes whose diet tags are unknown; those are judged on
+        their ingredients alone.
+        """
+        if diets is not None and not (self.diets & TAGGED_DIETS) <= diets:
+            return False
+        if mask is None:
+            mask = ingredient_mask(names)
+        if mask & self.excluded_mask:
+            return False
+        return not (self.excluded_words and
+                    self.excluded_words & ingredient_words(names))
+
+    def search_params(self):
+        """complexSearch filters that apply these restrictions upstream"""
+        params = {}
+        if self.diets:
+            params['diet'] = ','.join(sorted(self.diets))
+        intolerances = sorted(INTOLERANCES[group] for group, bit in GROUP_BITS.items()
+                              if bit & self.excluded_mask and group in INTOLERANCES)
+        if intolerances:
+            params['intolerances'] = ','.join(intolerances)
+        if self.excluded_items:
+            params['excludeIngredients'] = ','.join(sorted(self.excluded_items))
+        return params
+
+
+def as_text(value):
+    """Free text from a request field: lists are joined with commas"""
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value if item is not None)
+    return str(value or '')
+
+
+def compile_restrictions(restrictions):
+    """Compile free-text restrictions, separated by commas, semicolons,
+    'and', 'or' or '&', or given as a list"""
+    return _compile(as_text(restrictions))
+
+
+@lru_cache(maxsize=1024)
+def _compile(text):
+    diets, mask, words = set(), 0, set()
+    for part in _SEPARATORS.split(text.lower()):
+        tokens = _tokens(part)
+        phrase = ' '.join(tokens)
+        if not phrase or phrase in NO_RESTRICTIONS:
+            continue
+        if phrase in DIETS:
+            diet, excluded = DIETS[phrase]
+            diets.add(diet)
+            mask |= excluded
+            continue
+        # "peanut free" -> peanut
+        item = ' '.join(token for token in tokens if token != 'free')
+        group = _group(item) if item else None
+        if group:
+            mask |= GROUP_BITS[group]
+            continue
+        # Group names inside longer items ("peanut butter", "shellfish
+        # stock"); other items are matched as words
+        groups = [_group(token) for token in item.split()]
+        if any(groups):
+            for group in groups:
+                if group:
+                    mask |= GROUP_BITS[group]
+        elif item:
+            words.add(item)
+    return RestrictionProfile(frozenset(diets), mask, frozenset(words))
+
+
+def parse_liked_foods(text):
+    """Normalized names of foods a user likes"""
+    foods = set()
+    for part in re.split(r'[,;\n]|\band\b', as_text(text).lower()):
+        item = ' '.join(part.replace('-', ' ').split())
+        if item:
+            foods.add(singular(item))
+    return frozenset(foods)
@@ -0,0 +1,141 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Cache for LLM answers keyed on normalized text. Besides exact matches on
+# the normalized key, near-duplicates ("is rice healthy?" / "is rice
+# healthy") are found through an inverted index of character trigrams and
+# served when their Jaccard similarity reaches the threshold and they differ
+# only in stopwords: "lose weight" vs "gain weight" or "100g" vs "200g"
+# never match, however similar the rest of the text is. Entries expire
+# after `ttl` seconds and the least recently used are evicted beyond
+# `max_entries`.
+
+NGRAM = 3
+
+# Words that may differ between near-duplicates. Negations and quantities
+# are deliberately not here.
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'am', 'to', 'of', 'in',
+    'on', 'for', 'with', 'what', "what's", 'whats', 'how', 'do', 'does', 'can',
+    'could', 'should', 'would', 'i', 'me', 'my', 'you', 'your', 'it', "it's",
+    'its', 'that', 'this', 'some', 'any', 'please', 'tell', 'about', 'there',
+    'hey', 'hi', 'hello', 'thanks', 'thank', 'just', 'really'
+})
+
+
+def normalize_prompt(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return ' '.join(re.sub(r"[^a-z0-9' ]", ' ', str(text).lower()).split())
+
+
+def ngrams(text):
+    """Character trigrams of a normalized text, padded at the ends"""
+    padded = f" {text} "
+    return {padded[i:i + NGRAM] for i in range(max(1, len(padded) - NGRAM + 1))}
+
+
+def content_words(text):
+    """Words of a normalized text other than stopwords, in order"""
+    return tuple(word for word in text.split() if word not in STOPWORDS)
+
+
+class SemanticCache:
+    def __init__(self, ttl=24 * 3600, max_entries=5000, threshold=0.85):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 1.0 disables near-duplicate matching
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._grams = {}
+        self._words = {}
+        self._index = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        del self._entries[key]
+        del self._words[key]
+        for gram in self._grams.pop(key, ()):
+            keys = self._index[gram]
+            keys.discard(key)
+            if not keys:
+                del self._index[gram]
+
+    def _nearest(self, key):
+        """Most similar cached key at or above the threshold, or None"""
+        grams = ngrams(key)
+        # A key with Jaccard similarity >= t shares at least t*|grams| of
+        # these grams, so it must contain one of the |grams| - ceil(t*|grams|)
+        # + 1 rarest; only those postings need scanning
+        needed = math.ceil(self.threshold * len(grams))
+        rarest = sorted(grams, key=lambda gram: len(self._index.get(gram, ())))
+        candidates = set()
+        for gram in rarest[:len(grams) - needed + 1]:
+            candidates.update(self._index.get(gram, ()))
+
+        words = content_words(key)
+        best, best_score = None, self.threshold
+        for other in candidates:
+            other_grams = self._grams[other]
+            # Sets whose sizes differ too much can't reach the threshold
+            if not needed <= len(other_grams) <= len(grams) / self.threshold:
+                continue
+            if self._words[other] != words:
+                continue
+            overlap = len(grams & other_grams)
+            score = overlap / (len(grams) + len(other_grams) - overlap)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    def get(self, text):
+        """Cached value for text or a near-duplicate of it, or None"""
+        key = normalize_prompt(text)
+        now = time.monotonic()
+        with self._lock:
+            match = key if key in self._entries else None
+            if match is None and self.threshold < 1:
+                match = self._nearest(key)
+            if match is not None:
+                value, stored_at = self._entries[match]
+                if now - stored_at < self.ttl:
+                    self._entries.move_to_end(match)
+                    if match == key:
+                        self.hits += 1
+                    else:
+                        self.near_hits += 1
+                    return value
+                self._remove(match)
+            self.misses += 1
+            return None
+
+    def put(self, text, value):
+        key = normalize_prompt(text)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic())
+            self._words[key] = content_words(key)
+            grams = self._grams[key] = ngrams(key)
+            for gram in grams:
+                self._index.setdefault(gram, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        total = self.hits + self.near_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'similarity_threshold': self.threshold,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.near_hits) / total, 3) if total else 0.0
+        }
@@ -0,0 +1,225 @@
+import json
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from sqlite_local import ThreadLocalSQLite
+
+# Server-side sessions. The cookie holds only a random session ID; the
+# session data (the user ID and a summary of the user for auth checks) lives
+# in a SessionStore: an in-memory cache in front of a pluggable backend. The
+# SQLite backend is shared by every worker process, so a session started in
+# one worker is valid in all of them. Sessions expire `ttl` seconds after
+# their last renewal and expired ones are removed in periodic bulk sweeps.
+
+
+class MemorySessionBackend:
+    """Sessions in process memory; only for a single worker"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            return self._sessions.get(sid)
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self, now):
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._sessions.items()
+                       if expires_at <= now]
+            for sid in expired:
+                del self._sessions[sid]
+            return len(expired)
+
+
+class SQLiteSessionBackend:
+    """Sessions in a SQLite database shared across worker processes"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = ThreadLocalSQLite(db_path)
+        self._db.connect().execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        self._db.connect().execute(
+            'CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+
+    def load(self, sid):
+        row = self._db.connect().execute(
+            'SELECT data, expires_at FROM sessions WHERE id = ?', (sid,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires_at):
+        self._db.connect().execute(
+            'INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)',
+            (sid, json.dumps(data), expires_at))
+
+    def delete(self, sid):
+        self._db.connect().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+    def sweep(self, now):
+        return self._db.connect().execute(
+            'DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
+
+
+class SessionStore:
+    def __init__(self, backend, ttl=7 * 24 * 3600, local_ttl=10,
+                 sweep_interval=300, max_local=10000):
+        self.backend = backend
+        self.ttl = ttl
+        # How long a worker trusts its in-memory copy before re-reading the
+        # backend, i.e. how soon it sees a logout done by another worker
+        self.local_ttl = local_ttl
+        self.sweep_interval = sweep_interval
+        self.max_local = max_local
+        self._local = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.hits = 0
+        self.loads = 0
+        self.expired = 0
+        self.sweeps = 0
+
+    def _maybe_sweep(self, now):
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+            for sid in [sid for sid, (_, expires_at, _) in self._local.items()
+                        if expires_at <= now]:
+                del self._local[sid]
+        removed = self.backend.sweep(now)
+        with self._lock:
+            self.sweeps += 1
+            self.expired += removed
+
+    def _cache(self, sid, data, expires_at, now):
+        with self._lock:
+            if len(self._local) >= self.max_local and sid not in self._local:
+                self._local.pop(next(iter(self._local)))
+            self._local[sid] = (data, expires_at, now)
+
+    def get(self, sid):
+        """(data, expires_at) of a live session, or None"""
+        now = time.time()
+        self._maybe_sweep(now)
+        with self._lock:
+            entry = self._local.get(sid)
+            if entry is not None and now - entry[2] < self.local_ttl:
+                data, expires_at, _ = entry
+                if expires_at > now:
+                    self.hits += 1
+                    return data, expires_at
+        stored = self.backend.load(sid)
+        with self._lock:
+            self.loads += 1
+        if stored is None or stored[1] <= now:
+            with self._lock:
+                self._local.pop(sid, None)
+            return None
+        self._cache(sid, stored[0], stored[1], now)
+        return stored
+
+    def save(self, sid, data):
+        """Store a session's data, renewing it; returns the new expiry time"""
+        now = time.time()
+        expires_at = now + self.ttl
+        self.backend.save(sid, data, expires_at)
+        self._cache(sid, data, expires_at, now)
+        return expires_at
+
+    def delete(self, sid):
+        self.backend.delete(sid)
+        with self._lock:
+            self._local.pop(sid, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'ttl_seconds': self.ttl,
+                'local_entries': len(self._local),
+                'local_hits': self.hits,
+                'backend_loads': self.loads,
+                'sweeps': self.sweeps,
+                'expired_removed': self.expired
+            }
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the session to a new ID when it is saved, e.g. on login, so
+        an ID planted before sign-in is worthless"""
+        if self.sid:
+            self.previous_sid, self.sid = self.sid, None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in a SessionStore"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        stored = self.store.get(sid) if sid else None
+        if stored is None:
+            return ServerSession()
+        data, expires_at = stored
+        return ServerSession(data, sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+        if not session:
+            if session.modified and (session.sid or session.previous_sid):
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Renew once half the lifetime has passed, so reads don't write
+        renew = session.expires_at is None or \
+            session.expires_at - time.time() < self.store.ttl / 2
+        if not (session.modified or renew):
+            return
+        sid = session.sid or secrets.token_urlsafe(32)
+        expires_at = self.store.save(sid, dict(session))
+        response.vary.add('Cookie')
+        response.set_cookie(
+            name, sid,
+            expires=datetime.fromtimestamp(expires_at, timezone.utc),
+            domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app))
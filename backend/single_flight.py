@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import Future
+
+# Request coalescing: while a call for a key is in flight, other callers
+# asking for the same key wait for it and share its result instead of
+# sending their own identical request upstream.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time and return its result to every
+        caller that asked for the key while it was running"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        return {
+            'executed': self.executed,
+            'shared': self.shared,
+            'in_flight': len(self._calls)
+        }
@@ -0,0 +1,103 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import UpstreamBusyError
+from single_flight import SingleFlight
+
+# Shared HTTP client for the Spoonacular API. A single requests.Session keeps
+# a pool of keep-alive connections so calls reuse the TCP+TLS connection
+# instead of opening a new one each time. With a scheduler, every request
+# waits for a rate-limited slot (see rate_limit.py) before it is sent; with
+# a quota tracker, every response is accounted for (see quota.py). Retries
+# happen here rather than in urllib3, so each attempt takes its own slot and
+# is counted against the quota.
+
+BASE_URL = 'https://api.spoonacular.com'
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest wait between attempts, even when Retry-After asks for more
+MAX_BACKOFF = 120
+
+
+class SpoonacularBusyError(requests.RequestException):
+    """No request slot was free in time, or today's points are spent"""
+
+
+class SpoonacularClient:
+    def __init__(self, api_key, base_url=BASE_URL, pool_size=20,
+                 connect_timeout=5, read_timeout=15, retries=3, backoff=0.5,
+                 scheduler=None, quota=None):
+        self.api_key = api_key
+        self.scheduler = scheduler
+        self.quota = quota
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Identical concurrent GETs share one upstream request
+        self.flights = SingleFlight()
+
+    def get(self, endpoint, params=None, timeout=None):
+        """GET a Spoonacular endpoint (e.g. 'recipes/complexSearch') and
+        return the response; the API key is added automatically"""
+        endpoint = endpoint.lstrip('/')
+        params = dict(params or {})
+        key = (endpoint,) + tuple(sorted((k, str(v)) for k, v in params.items()))
+        params['apiKey'] = self.api_key
+        return self.flights.do(key, lambda: self._send(
+            endpoint, params, timeout or self.timeout))
+
+    def _send(self, endpoint, params, timeout):
+        """Send a GET, retrying connection errors, rate limiting and
+        transient server errors"""
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self._attempt(url, params, timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if self.quota is not None:
+                self.quota.record(endpoint, response)
+            if last or response.status_code not in RETRY_STATUSES:
+                return response
+            # Hand the connection back to the pool while we wait
+            response.close()
+            time.sleep(self._retry_delay(response, attempt))
+
+    def _attempt(self, url, params, timeout):
+        """One upstream request, in its own scheduler slot"""
+        if self.scheduler is None:
+            return self.session.get(url, params=params, timeout=timeout)
+        try:
+            with self.scheduler.slot():
+                return self.session.get(url, params=params, timeout=timeout)
+        except UpstreamBusyError as e:
+            raise SpoonacularBusyError(str(e)) from e
+
+    def _backoff(self, attempt):
+        return min(self.backoff * 2 ** attempt, MAX_BACKOFF)
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying a response, from Retry-After if sent"""
+        try:
+            return min(max(0.0, float(response.headers['Retry-After'])), MAX_BACKOFF)
+        except (KeyError, ValueError):
+            return self._backoff(attempt)
+
+    def get_json(self, endpoint, params=None, timeout=None):
+        """GET an endpoint and return its JSON body, raising on HTTP errors"""
+        response = self.get(endpoint, params, timeout)
+        response.raise_for_status()
+        return response.json()
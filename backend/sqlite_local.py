@@ -0,0 +1,27 @@
+import sqlite3
+import threading
+
+# Per-thread SQLite connections for the on-disk stores. Connections aren't
+# shared between threads, so each thread opens its own on first use, in
+# autocommit mode with WAL journaling so readers don't block the writer.
+
+
+class ThreadLocalSQLite:
+    def __init__(self, db_path, synchronous='NORMAL', timeout=30):
+        self.db_path = db_path
+        # None keeps SQLite's default (FULL)
+        self.synchronous = synchronous
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connect(self):
+        """Return this thread's SQLite connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            if self.synchronous:
+                conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,82 @@
+import pytest
+
+from restrictions import GROUP_BITS, compile_restrictions
+
+
+def groups(profile):
+    return {group for group, bit in GROUP_BITS.items() if bit & profile.excluded_mask}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("I'm allergic to peanuts", {'peanut'}),
+    ('no peanuts!', {'peanut'}),
+    ('severe peanut allergy', {'peanut'}),
+    ('peanut free', {'peanut'}),
+    ('no nuts or shellfish', {'tree nut', 'shellfish'}),
+    ('no nuts & shellfish', {'tree nut', 'shellfish'}),
+    ('lactose intolerant', {'dairy'}),
+    ("I don't eat pork", {'pork'}),
+])
+def test_allergen_phrasings(text, expected):
+    profile = compile_restrictions(text)
+    assert groups(profile) == expected
+    assert not profile.excluded_items
+
+
+@pytest.mark.parametrize('text, diet', [
+    ("I'm vegetarian", 'vegetarian'),
+    ('vegan diet', 'vegan'),
+    ('Vegetarian.', 'vegetarian'),
+    ('gluten-free', 'gluten free'),
+    ('Keto!', 'ketogenic'),
+])
+def test_diet_phrasings(text, diet):
+    assert compile_restrictions(text).diets == {diet}
+
+
+def test_vegetarian_rejects_meat():
+    profile = compile_restrictions("I'm vegetarian")
+    assert not profile.allows(None, {'chicken breast', 'rice'})
+    assert profile.allows(None, {'tofu', 'rice'})
+
+
+def test_other_items_are_clean_words():
+    profile = compile_restrictions('dairy free, no mushrooms!; hate cilantro')
+    assert profile.excluded_items == {'mushrooms', 'cilantro'}
+    assert profile.search_params()['excludeIngredients'] == 'cilantro,mushrooms'
+
+
+@pytest.mark.parametrize('text', ['', 'none', 'n/a', 'None.'])
+def test_no_restrictions(text):
+    assert not compile_restrictions(text)
+
+
+def test_list_of_restrictions():
+    profile = compile_restrictions(['nuts', "I'm vegetarian", 'no mushrooms'])
+    assert groups(profile) == {'tree nut', 'meat', 'fish', 'shellfish'}
+    assert profile.diets == {'vegetarian'}
+    assert profile.excluded_items == {'mushrooms'}
+
+
+@pytest.mark.parametrize('names', [
+    {'goat cheese crumbles', 'beet'},
+    {'cauliflower steaks', 'olive oil'},
+    {'coconut meat'},
+])
+def test_vegetarian_allows_meatless_compounds(names):
+    assert compile_restrictions('vegetarian').allows(None, names)
+
+
+@pytest.mark.parametrize('names', [
+    {'goat', 'onion'},
+    {'flank steak'},
+    {'beef steak'},
+])
+def test_vegetarian_rejects_meat_words(names):
+    assert not compile_restrictions('vegetarian').allows(None, names)
+
+
+def test_compounds_keep_their_real_group():
+    assert not compile_restrictions('dairy free').allows(None, {'goat cheese'})
+    assert not compile_restrictions('no fish').allows(None, {'tuna steak'})
+    assert compile_restrictions('pescatarian').allows(None, {'crab meat'})
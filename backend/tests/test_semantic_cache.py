@@ -0,0 +1,28 @@
+import pytest
+
+from semantic_cache import SemanticCache
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ('What are healthy snacks for a student who is trying to lose weight?',
+     'What are healthy snacks for a student who is trying to gain weight?'),
+    ('How many calories in 100g of chicken breast?',
+     'How many calories in 200g of chicken breast?'),
+    ('Is rice healthier than quinoa?', 'Is quinoa healthier than rice?'),
+    ('Is peanut butter healthy?', 'Is peanut butter not healthy?'),
+])
+def test_different_questions_do_not_match(cached, asked):
+    cache = SemanticCache(threshold=0.85)
+    cache.put(cached, 'answer')
+    assert cache.get(asked) is None
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ('Is rice healthy?', 'is rice healthy'),
+    ('What are some good sources of protein?', 'what are good sources of protein'),
+    ('How many calories in an apple?', 'Hey, how many calories in an apple?'),
+])
+def test_near_duplicates_match(cached, asked):
+    cache = SemanticCache(threshold=0.85)
+    cache.put(cached, 'answer')
+    assert cache.get(asked) == 'answer'
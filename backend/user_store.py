@@ -0,0 +1,537 @@
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from sqlite_local import ThreadLocalSQLite
+
+# SQLite-backed user storage. Each account is stored as its own row so a
+# read or write only touches one user record instead of re-parsing and
+# re-serializing every account in users.json.
+
+# Fields with a username/email -> user_id lookup index
+INDEXED_FIELDS = ('username', 'email')
+
+# List sections are stored one item per row so they can be appended to,
+# patched and paged through without rewriting the whole list
+LIST_SECTIONS = ('meal_plans', 'calendar_events', 'recommendations')
+
+
+def _item_key(item):
+    """Key used to address a list item in patches (its 'id', if it has one)"""
+    if isinstance(item, dict) and item.get('id') is not None:
+        return str(item['id'])
+    return None
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def peek(self, key):
+        """Look up an entry without touching LRU order or hit counters"""
+        with self._lock:
+            return self._data.get(key)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class DuplicateUserError(Exception):
+    """Raised when a new user's username or email is already taken"""
+
+    def __init__(self, field):
+        super().__init__(f"{field} already exists")
+        self.field = field
+
+
+class GroupCommitter:
+    """Background writer that commits writes arriving close together as one
+    transaction, so a burst of saves costs a single fsync"""
+
+    def __init__(self, store, window_ms):
+        self.store = store
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, op):
+        future = Future()
+        self._queue.put((op, future))
+        return future.result()
+
+    def _run(self):
+        # Durability is paid once per batch, so make each commit a real fsync
+        self.store._db.connect().execute('PRAGMA synchronous=FULL')
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            with self.store._transaction() as (conn, written):
+                for op, future in batch:
+                    # A failing op only undoes its own changes
+                    conn.execute('SAVEPOINT write_op')
+                    try:
+                        outcomes.append((future, op(conn, written), None))
+                        conn.execute('RELEASE write_op')
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO write_op')
+                        conn.execute('RELEASE write_op')
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            for op, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in outcomes:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'window_ms': self.window * 1000,
+            'batches': self.batches,
+            'writes': self.writes,
+            'pending': self._queue.qsize()
+        }
+
+
+class UserStore:
+    def __init__(self, db_path, legacy_json_path=None, cache_size=512,
+                 group_commit_ms=0):
+        self.db_path = db_path
+        self._db = ThreadLocalSQLite(db_path)
+        # Records handed out from the cache are shared; treat them as read-only
+        self.cache = LRUCache(cache_size)
+        self._generation = None
+        self._generation_lock = threading.Lock()
+        self._init_schema()
+        if legacy_json_path:
+            self._import_legacy_json(legacy_json_path)
+        self._migrate_list_sections()
+        self.rebuild_indexes()
+        self._committer = None
+        if group_commit_ms > 0:
+            self._committer = GroupCommitter(self, group_commit_ms)
+
+    def _init_schema(self):
+        conn = self._db.connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                record TEXT NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_index (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                PRIMARY KEY (field, value)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_items (
+                user_id TEXT NOT NULL,
+                section TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                item_key TEXT,
+                item TEXT NOT NULL,
+                PRIMARY KEY (user_id, section, seq)
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS user_items_key
+            ON user_items (user_id, section, item_key)
+        ''')
+        # Write counter shared by every process using the database, used to
+        # notice when another worker has changed records we have cached
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)")
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction and bump the shared write generation.
+
+        Yields the connection and a dict that callers fill with the records
+        they wrote; those are written through to the cache after commit
+        (a None record just evicts the user).
+        """
+        conn = self._db.connect()
+        written = {}
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn, written
+            conn.execute(
+                "UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            generation = self._read_generation(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        with self._generation_lock:
+            if self._generation == generation - 1:
+                self._generation = generation
+                for user_id, user in written.items():
+                    if user is None:
+                        self.cache.pop(user_id)
+                    else:
+                        self.cache.put(user_id, user)
+            else:
+                # Another write landed in between; the next read resyncs
+                for user_id in written:
+                    self.cache.pop(user_id)
+
+    def _write(self, op):
+        """Run op(conn, written) inside a write transaction.
+
+        The whole read-modify-write happens under SQLite's write lock, which
+        serializes writers across threads and worker processes. With group
+        commit enabled the op is handed to the background committer instead.
+        """
+        if self._committer:
+            return self._committer.submit(op)
+        with self._transaction() as (conn, written):
+            return op(conn, written)
+
+    def _read_generation(self, conn):
+        return conn.execute(
+            "SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def _sync_cache(self):
+        """Drop cached records if another process has written since we looked"""
+        generation = self._read_generation(self._db.connect())
+        with self._generation_lock:
+            if generation != self._generation:
+                self.cache.clear()
+                self._generation = generation
+            return generation
+
+    def rebuild_indexes(self):
+        """Recompute the lookup indexes from the stored user records"""
+        with self._transaction() as (conn, written):
+            conn.execute('DELETE FROM user_index')
+            for (record,) in conn.execute('SELECT record FROM users'):
+                self._index_user(conn, json.loads(record))
+
+    def _index_user(self, conn, user):
+        for field in INDEXED_FIELDS:
+            if user.get(field):
+                conn.execute(
+                    'INSERT OR IGNORE INTO user_index (field, value, user_id) VALUES (?, ?, ?)',
+                    (field, user[field], user['id']))
+
+    def _import_legacy_json(self, json_path):
+        """Copy accounts from the old users.json file into an empty store"""
+        conn = self._db.connect()
+        if conn.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+            return
+        try:
+            with open(json_path, 'r') as f:
+                users = json.load(f).get('users', {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        with self._transaction() as (conn, written):
+            # Another worker starting at the same time may have imported
+            # while we waited for the write lock
+            if conn.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+                return
+            for user in users.values():
+                self._save_record(conn, user)
+        print(f"Imported {len(users)} users from {json_path}")
+
+    def _migrate_list_sections(self):
+        """Move list sections of records written by older versions into user_items"""
+        conn = self._db.connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'items_migrated'").fetchone():
+            return
+        with self._transaction() as (conn, written):
+            # Another worker starting at the same time may have migrated
+            # while we waited for the write lock
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'items_migrated'").fetchone():
+                return
+            for (record,) in conn.execute('SELECT record FROM users').fetchall():
+                user = json.loads(record)
+                # Already-split records only hold empty placeholders
+                if any(user.get(section) for section in LIST_SECTIONS):
+                    self._save_record(conn, user)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('items_migrated', 1)")
+
+    def _save_record(self, conn, user):
+        """Write a full user record, splitting list sections into user_items"""
+        record = dict(user)
+        for section in LIST_SECTIONS:
+            if isinstance(record.get(section), list):
+                self._replace_items(conn, user['id'], section, record[section])
+                # The record only keeps an empty placeholder for the section
+                record[section] = []
+        conn.execute('INSERT OR REPLACE INTO users (id, record) VALUES (?, ?)',
+                     (user['id'], json.dumps(record)))
+
+    def _load_record(self, conn, user_id):
+        """Read a full user record, reassembling its list sections"""
+        row = conn.execute(
+            'SELECT record FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not row:
+            return None
+        user = json.loads(row[0])
+        items = conn.execute(
+            'SELECT section, item FROM user_items WHERE user_id = ? ORDER BY section, seq',
+            (user_id,))
+        for section, item in items:
+            if isinstance(user.get(section), list):
+                user[section].append(json.loads(item))
+        return user
+
+    def _replace_items(self, conn, user_id, section, items):
+        conn.execute('DELETE FROM user_items WHERE user_id = ? AND section = ?',
+                     (user_id, section))
+        self._insert_items(conn, user_id, section, items, 0)
+
+    def _insert_items(self, conn, user_id, section, items, first_seq):
+        conn.executemany(
+            'INSERT INTO user_items (user_id, section, seq, item_key, item) VALUES (?, ?, ?, ?, ?)',
+            [(user_id, section, first_seq + offset, _item_key(item), json.dumps(item))
+             for offset, item in enumerate(items)])
+
+    def _next_seq(self, conn, user_id, section):
+        return conn.execute(
+            'SELECT COALESCE(MAX(seq), -1) + 1 FROM user_items WHERE user_id = ? AND section = ?',
+            (user_id, section)).fetchone()[0]
+
+    def _count_items(self, conn, user_id, section):
+        return conn.execute(
+            'SELECT COUNT(*) FROM user_items WHERE user_id = ? AND section = ?',
+            (user_id, section)).fetchone()[0]
+
+    def _has_list_section(self, conn, user_id, section):
+        row = conn.execute('SELECT json_type(record, ?) FROM users WHERE id = ?',
+                           (f'$.{section}', user_id)).fetchone()
+        return bool(row) and row[0] == 'array'
+
+    def _cached(self, user_id, written):
+        """Latest full record to write through to, or None if we hold none"""
+        if user_id in written:
+            return written[user_id]
+        self._sync_cache()
+        return self.cache.peek(user_id)
+
+    def get(self, user_id):
+        """Get a single user record by ID"""
+        generation = self._sync_cache()
+        user = self.cache.get(user_id)
+        if user is not None:
+            return user
+
+        user = self._load_record(self._db.connect(), user_id)
+        if user is None:
+            return None
+        with self._generation_lock:
+            # Skip the fill if a write committed while we were reading
+            if self._generation == generation:
+                self.cache.put(user_id, user)
+        return user
+
+    def find_id(self, field, value):
+        """Find the ID of the user whose `field` equals `value`"""
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Field {field} is not indexed")
+        row = self._db.connect().execute(
+            'SELECT user_id FROM user_index WHERE field = ? AND value = ?',
+            (field, value)).fetchone()
+        return row[0] if row else None
+
+    def insert(self, user):
+        """Store a new user record, enforcing unique usernames and emails"""
+        def op(conn, written):
+            for field in INDEXED_FIELDS:
+                if user.get(field) and conn.execute(
+                        'SELECT 1 FROM user_index WHERE field = ? AND value = ?',
+                        (field, user[field])).fetchone():
+                    raise DuplicateUserError(field)
+            self._save_record(conn, user)
+            self._index_user(conn, user)
+            written[user['id']] = user
+        self._write(op)
+
+    def update_field(self, user_id, field, value):
+        """Replace one top-level field of a user record"""
+        def op(conn, written):
+            row = conn.execute(
+                'SELECT record FROM users WHERE id = ?', (user_id,)).fetchone()
+            if not row:
+                return False
+            record = json.loads(row[0])
+            if field in LIST_SECTIONS:
+                if isinstance(value, list):
+                    self._replace_items(conn, user_id, field, value)
+                    record[field] = []
+                else:
+                    conn.execute(
+                        'DELETE FROM user_items WHERE user_id = ? AND section = ?',
+                        (user_id, field))
+                    record[field] = value
+            else:
+                record[field] = value
+            conn.execute('UPDATE users SET record = ? WHERE id = ?',
+                         (json.dumps(record), user_id))
+            if field in INDEXED_FIELDS:
+                conn.execute(
+                    'DELETE FROM user_index WHERE field = ? AND user_id = ?',
+                    (field, user_id))
+                self._index_user(conn, record)
+
+            user = self._cached(user_id, written)
+            if user is not None:
+                user = dict(user)
+                user[field] = value
+            written[user_id] = user
+            return True
+        return self._write(op)
+
+    def append_items(self, user_id, section, items):
+        """Append items to a list section; returns the new item count, or
+        None if the user has no such section"""
+        def op(conn, written):
+            if not self._has_list_section(conn, user_id, section):
+                return None
+            self._insert_items(conn, user_id, section, items,
+                               self._next_seq(conn, user_id, section))
+
+            user = self._cached(user_id, written)
+            if user is not None:
+                user = dict(user)
+                user[section] = user[section] + list(items)
+            written[user_id] = user
+            return self._count_items(conn, user_id, section)
+        return self._write(op)
+
+    def patch_items(self, user_id, section, upsert=(), remove=()):
+        """Replace or add items by 'id' and remove items by 'id' in a list
+        section; returns the new item count, or None if there is no such
+        section"""
+        remove_keys = {str(key) for key in remove}
+
+        def op(conn, written):
+            if not self._has_list_section(conn, user_id, section):
+                return None
+            conn.executemany(
+                'DELETE FROM user_items WHERE user_id = ? AND section = ? AND item_key = ?',
+                [(user_id, section, key) for key in remove_keys])
+            added = []
+            for item in upsert:
+                key = _item_key(item)
+                if key is None or not conn.execute(
+                        'UPDATE user_items SET item = ? WHERE user_id = ? AND section = ? AND item_key = ?',
+                        (json.dumps(item), user_id, section, key)).rowcount:
+                    added.append(item)
+            self._insert_items(conn, user_id, section, added,
+                               self._next_seq(conn, user_id, section))
+
+            user = self._cached(user_id, written)
+            if user is not None:
+                replacements = {_item_key(item): item for item in upsert
+                                if _item_key(item) is not None}
+                items = [replacements.get(_item_key(item), item)
+                         for item in user[section]
+                         if _item_key(item) not in remove_keys]
+                user = dict(user)
+                user[section] = items + added
+            written[user_id] = user
+            return self._count_items(conn, user_id, section)
+        return self._write(op)
+
+    def get_items(self, user_id, section, offset=0, limit=None):
+        """Read one page of a list section as (items, total), or None if the
+        user has no such section"""
+        self._sync_cache()
+        user = self.cache.get(user_id)
+        if user is not None:
+            items = user.get(section)
+            if not isinstance(items, list):
+                return None
+            end = None if limit is None else offset + limit
+            return items[offset:end], len(items)
+
+        conn = self._db.connect()
+        if not self._has_list_section(conn, user_id, section):
+            return None
+        rows = conn.execute(
+            'SELECT item FROM user_items WHERE user_id = ? AND section = ? ORDER BY seq LIMIT ? OFFSET ?',
+            (user_id, section, -1 if limit is None else limit, offset))
+        items = [json.loads(item) for (item,) in rows]
+        return items, self._count_items(conn, user_id, section)
+
+    def count(self):
+        return self._db.connect().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def group_commit_stats(self):
+        return self._committer.stats() if self._committer else None
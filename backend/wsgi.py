@@ -0,0 +1,3 @@
+# WSGI entry point for production servers, e.g.
+#   gunicorn --config gunicorn.conf.py wsgi:app
+from app import app  # noqa: F401
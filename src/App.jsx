@@ -11,7 +11,7 @@ import React, { useState, useEffect } from 'react'
 import reactLogo from './assets/react.svg'
 import viteLogo from '/vite.svg'
 import './App.css'
-import { searchRecipesByIngredients, generateMealPlan, addEventToGoogleCalendar, generateMealRecommendations } from './utils/api';
+import { searchRecipesByIngredients, generateMealPlan, addEventToGoogleCalendar, streamMealRecommendations, streamChatbotReply, appendUserData, patchUserData, estimateNutritionBatch } from './utils/api';
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:5001';
 
@@ -86,29 +86,23 @@ const Chatbot = () => {
     setInputMessage('');
     setIsLoading(true);
 
+    const botMessageId = Date.now() + 1;
     try {
-      const response = await fetch(`${BACKEND_URL}/api/chatbot`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          message: inputMessage
-        })
+      // Show the reply as it streams in
+      await streamChatbotReply(inputMessage, (_, textSoFar) => {
+        setIsLoading(false);
+        setMessages(prev => {
+          const botMessage = {
+            id: botMessageId,
+            text: textSoFar,
+            sender: 'bot',
+            timestamp: new Date()
+          };
+          return prev.some(message => message.id === botMessageId)
+            ? prev.map(message => (message.id === botMessageId ? botMessage : message))
+            : [...prev, botMessage];
+        });
       });
-
-      if (response.ok) {
-        const data = await response.json();
-        const botMessage = {
-          id: Date.now() + 1,
-          text: data.response,
-          sender: 'bot',
-          timestamp: new Date()
-        };
-        setMessages(prev => [...prev, botMessage]);
-      } else {
-        throw new Error('Failed to get response');
-      }
     } catch (error) {
       const errorMessage = {
         id: Date.now() + 1,
@@ -587,18 +581,12 @@ function DietInputForm() {
       console.log('Generated meal plan:', mealPlan);
       console.log('First meal details:', mealPlan.meals?.[0]);
       
-      // Save meal plan to user account
-      const mealPlanResponse = await fetch(`${BACKEND_URL}/api/user/data/meal_plans`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        credentials: 'include',
-        body: JSON.stringify([mealPlan])
-      });
-
-      if (!mealPlanResponse.ok) {
-        console.error('Failed to save meal plan');
+      // Save meal plan to user account; `days` repeats the meals shown, so
+      // it is left out of the stored record
+      try {
+        await appendUserData('meal_plans', [{ ...mealPlan, days: undefined, id: Date.now() }]);
+      } catch (saveError) {
+        console.error('Failed to save meal plan:', saveError);
       }
 
       localStorage.setItem('currentMealPlan', JSON.stringify(mealPlan));
@@ -1442,6 +1430,7 @@ function LocalCalendar() {
     ingredients: ''
   });
   const [nutritionLoading, setNutritionLoading] = useState(false);
+  const [weekNutritionLoading, setWeekNutritionLoading] = useState(false);
   const [mealPlan, setMealPlan] = useState(null);
   const [selectedDay, setSelectedDay] = useState(null);
 
@@ -1521,7 +1510,9 @@ function LocalCalendar() {
       calories: parseFloat(newEvent.calories) || 0,
       protein: parseFloat(newEvent.protein) || 0,
       carbs: parseFloat(newEvent.carbs) || 0,
-      fat: parseFloat(newEvent.fat) || 0
+      fat: parseFloat(newEvent.fat) || 0,
+      // Kept so the week's nutrition can be recalculated later
+      ingredients: newEvent.ingredients.trim()
     };
     
     const updatedEvents = [...events, event];
@@ -1529,28 +1520,11 @@ function LocalCalendar() {
     console.log('Updated events array:', updatedEvents);
     setEvents(updatedEvents);
     
-    // Save events to user account
+    // Save the new event to user account
     try {
-      console.log('Saving calendar events to backend...');
-      const response = await fetch(`${BACKEND_URL}/api/user/data/calendar_events`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        credentials: 'include',
-        body: JSON.stringify(updatedEvents)
-      });
-
-      console.log('Save response status:', response.status);
-      
-      if (response.ok) {
-        const result = await response.json();
-        console.log('Save successful:', result);
-      } else {
-        console.error('Failed to save calendar events');
-        const errorData = await response.json().catch(() => ({}));
-        console.error('Error details:', errorData);
-      }
+      console.log('Saving calendar event to backend...');
+      const result = await appendUserData('calendar_events', [event]);
+      console.log('Save successful:', result);
     } catch (error) {
       console.error('Error saving calendar events:', error);
     }
@@ -1623,6 +1597,42 @@ function LocalCalendar() {
     }
   };
 
+  // Re-estimate every custom meal this week that has ingredients, in one request
+  const recalculateWeekNutrition = async () => {
+    const weekDays = getWeekDates().map(date => date.toISOString().split('T')[0]);
+    const weekEvents = events.filter(event =>
+      weekDays.includes(event.date) && !event.isFromMealPlan && event.ingredients);
+    if (weekEvents.length === 0) {
+      alert('No custom meals with ingredients this week.');
+      return;
+    }
+
+    setWeekNutritionLoading(true);
+    try {
+      const data = await estimateNutritionBatch(weekEvents.map(event => ({
+        title: event.title,
+        ingredients: event.ingredients
+      })));
+
+      const updated = weekEvents.map((event, index) => ({
+        ...event,
+        calories: data.meals[index].calories,
+        protein: data.meals[index].protein,
+        carbs: data.meals[index].carbs,
+        fat: data.meals[index].fat
+      }));
+      const updatedById = new Map(updated.map(event => [event.id, event]));
+      setEvents(events.map(event => updatedById.get(event.id) || event));
+
+      await patchUserData('calendar_events', { upsert: updated });
+    } catch (error) {
+      console.error('Error recalculating week nutrition:', error);
+      alert(`Could not recalculate nutrition: ${error.message}`);
+    } finally {
+      setWeekNutritionLoading(false);
+    }
+  };
+
   const addMealPlanToDate = () => {
     if (!mealPlan || !mealPlan.meals || !selectedDay) return;
     
@@ -1644,15 +1654,8 @@ function LocalCalendar() {
     const updatedEvents = [...events, ...mealPlanEvents];
     setEvents(updatedEvents);
     
-    // Save updated events
-    fetch(`${BACKEND_URL}/api/user/data/calendar_events`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      credentials: 'include',
-      body: JSON.stringify(updatedEvents)
-    }).catch(error => {
+    // Save the new events
+    appendUserData('calendar_events', mealPlanEvents).catch(error => {
       console.error('Error saving meal plan events:', error);
     });
     
@@ -1673,20 +1676,9 @@ function LocalCalendar() {
     const updatedEvents = events.filter(event => event.id !== eventId);
     setEvents(updatedEvents);
     
-    // Save updated events to user account
+    // Remove the event from user account
     try {
-      const response = await fetch(`${BACKEND_URL}/api/user/data/calendar_events`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        credentials: 'include',
-        body: JSON.stringify(updatedEvents)
-      });
-
-      if (!response.ok) {
-        console.error('Failed to save updated calendar events');
-      }
+      await patchUserData('calendar_events', { remove: [eventId] });
     } catch (error) {
       console.error('Error saving updated calendar events:', error);
     }
@@ -1853,6 +1845,14 @@ function LocalCalendar() {
               Add Meal Plan to Selected Date
             </button>
           )}
+          <button
+            onClick={recalculateWeekNutrition}
+            className="btn btn-secondary"
+            disabled={weekNutritionLoading}
+            style={{ marginLeft: '1rem' }}
+          >
+            {weekNutritionLoading ? 'Recalculating...' : 'Recalculate Week Nutrition'}
+          </button>
         </div>
       </div>
 
@@ -2094,7 +2094,11 @@ function RecommendationsPage() {
       console.log('Meal plan data:', mealPlan);
       console.log('Generating recommendations with preferences:', userPreferences);
 
-      const response = await generateMealRecommendations(userPreferences);
+      // Render the recommendations as they stream in
+      const response = await streamMealRecommendations(userPreferences, (_, textSoFar) => {
+        setRecommendations(textSoFar);
+        setLoading(false);
+      });
 
       if (response && response.recommendations) {
         setRecommendations(response.recommendations);
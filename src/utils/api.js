@@ -119,6 +119,90 @@ export async function generateMealRecommendations(userPreferences) {
   }
 }
 
+// POST to a streaming backend endpoint and read its Server-Sent Events.
+// onText is called with each piece of text as it arrives; resolves to
+// { text, modelUsed } once the stream is done.
+async function streamBackendEvents(path, body, onText) {
+  const response = await fetch(`${BACKEND_URL}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify(body)
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ error: 'Unknown error' }));
+    throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let text = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      const payload = data ? JSON.parse(data) : {};
+
+      if (eventName === 'error') {
+        throw new Error(payload.error || 'Stream failed');
+      }
+      if (eventName === 'done') {
+        return { text, modelUsed: payload.model_used };
+      }
+      if (payload.text) {
+        text += payload.text;
+        onText?.(payload.text, text);
+      }
+    }
+  }
+
+  return { text, modelUsed: null };
+}
+
+// Stream a chatbot reply; onText(piece, fullTextSoFar) is called as it arrives
+export async function streamChatbotReply(message, onText) {
+  return streamBackendEvents('/api/chatbot/stream', { message }, onText);
+}
+
+// Stream meal recommendations; onText(piece, fullTextSoFar) is called as they arrive
+export async function streamMealRecommendations(userPreferences, onText) {
+  try {
+    const { text } = await streamBackendEvents(
+      '/api/generate-recommendations/stream', { userPreferences }, onText);
+    if (!text) {
+      throw new Error('No recommendations received from backend');
+    }
+    return { recommendations: text, success: true };
+  } catch (error) {
+    console.error('Error streaming recommendations from backend:', error);
+    if (error.message.includes('fetch')) {
+      throw new Error('Unable to connect to backend service. Please make sure the backend is running on port 5001.');
+    } else if (error.message.includes('API key')) {
+      throw new Error('AI service not configured on backend. Please check backend configuration.');
+    } else {
+      throw new Error('Failed to generate recommendations: ' + error.message);
+    }
+  }
+}
+
 // Estimate nutrition for custom meals
 export async function estimateNutrition(mealData) {
   try {
@@ -142,4 +226,67 @@ export async function estimateNutrition(mealData) {
   }
 }
 
+// Estimate nutrition for many meals in one request.
+// meals: [{ title, ingredients: [{ name, quantity, unit }] }]
+export async function estimateNutritionBatch(meals) {
+  try {
+    const response = await fetch(`${BACKEND_URL}/api/estimate-nutrition/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ meals })
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({ error: 'Unknown error' }));
+      throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+    }
+
+    return response.json();
+  } catch (error) {
+    console.error('Error estimating nutrition:', error);
+    throw new Error('Failed to estimate nutrition: ' + error.message);
+  }
+}
+
+
+
+async function userDataRequest(path, options = {}) {
+  const response = await fetch(`${BACKEND_URL}/api/user/data/${path}`, {
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    credentials: 'include',
+    ...options
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ error: 'Unknown error' }));
+    throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+  }
+
+  return response.json();
+}
+
+// Append items to a list section (meal_plans, calendar_events, recommendations)
+// without re-sending the items already saved
+export async function appendUserData(dataType, items) {
+  return userDataRequest(`${dataType}/append`, {
+    method: 'POST',
+    body: JSON.stringify(items)
+  });
+}
 
+// Replace/add items by id and remove items by id in a list section
+export async function patchUserData(dataType, { upsert = [], remove = [] }) {
+  return userDataRequest(dataType, {
+    method: 'PATCH',
+    body: JSON.stringify({ upsert, remove })
+  });
+}
+
+// Read one page of a list section; resolves to { [dataType]: items, offset, limit, total }
+export async function getUserDataPage(dataType, offset = 0, limit = 20) {
+  return userDataRequest(`${dataType}?offset=${offset}&limit=${limit}`);
+}